@@ -0,0 +1,319 @@
+# bulk_generate.py
+#
+# Offline bulk generation through the provider's Batch API, for the nightly jobs that used to call
+# OpenAIClient.single_response / ChatClient.find_issue once per prompt.
+#
+#   python -m app.jobs.bulk_generate prompts.jsonl results.jsonl
+#   python -m app.jobs.bulk_generate conversations.jsonl issues.jsonl --mode find-issue --issues issues.json
+#
+# Input is JSONL or CSV and is read one record at a time:
+# - generate:   {"id": ..., "prompt": ...}
+# - find-issue: {"id": ..., "conversation": {"messages": [...]}}  (in CSV the conversation column holds that JSON)
+# Records without an id get "line-<n>" from their position in the input; ids must be unique, since the Batch API
+# rejects a file with duplicate custom_ids.
+#
+# Records are written into shard files of at most --shard-size requests, each shard is uploaded and submitted
+# as its own batch, and the results are written to the output as JSONL, one line per record, in completion
+# order, after anything the file already held. Progress is kept in a checkpoint file next to the output: re-running the same command after a crash
+# (or after --no-wait) picks up where the previous run stopped instead of submitting anything twice.
+# Point --base-url at a local stand-in server to run the whole pipeline without the real API.
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import openai
+
+from app.models.schemas import ConversationModel, Issue
+from app.services.chat_client import DEFAULT_ISSUES, ChatClient
+from app.services.openai_client import OPENAI_API_KEY, OpenAIModel
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# The Batch API accepts up to 50,000 requests per input file
+BATCH_MAX_SHARD_SIZE = 50000
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+MODES = ("generate", "find-issue")
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for record in csv.DictReader(f):
+                yield record
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Checkpoint:
+    """
+    Job state persisted as JSON after every step. Writes go through a temporary file and os.replace,
+    so a crash leaves either the previous state or the new one, never a torn file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Any] = {"prepared": False, "local_written": False, "output_size": 0, "shards": []}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    @property
+    def shards(self) -> List[Dict[str, Any]]:
+        return self.state["shards"]
+
+    def save(self) -> None:
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temporary_path, self.path)
+
+
+class BulkJob:
+
+    def __init__(self, args: argparse.Namespace, client: openai.AsyncOpenAI):
+        self.args = args
+        self.client = client
+        self.work_dir = args.work_dir or f"{args.output}.work"
+        self.checkpoint = Checkpoint(args.checkpoint or os.path.join(self.work_dir, "checkpoint.json"))
+        self.issues = DEFAULT_ISSUES
+        if args.issues:
+            with open(args.issues, encoding="utf-8") as f:
+                self.issues = [Issue.model_validate(issue) for issue in json.load(f)]
+        self._chat_client: Optional[ChatClient] = None
+
+    @property
+    def chat_client(self) -> ChatClient:
+        # Only find-issue needs it, for the local issue prefilter, rendering the prompts and parsing the answers
+        if self._chat_client is None:
+            self._chat_client = ChatClient(issues=self.issues, model=self.args.model)
+        return self._chat_client
+
+    def _request_line(self, custom_id: str, prompt: str) -> str:
+        return json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": OpenAIModel(self.args.model).value,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0 if self.args.mode == "find-issue" else self.args.temperature,
+                "max_tokens": self.args.max_tokens,
+            },
+        })
+
+    def _prompt_for(self, record: Dict[str, Any]) -> Optional[str]:
+        """
+        Returns the prompt for a record, or None when find-issue can answer it locally, in which case
+        the answer has already been written to the local results file.
+        """
+        if self.args.mode == "generate":
+            return record["prompt"]
+
+        conversation = record["conversation"]
+        if isinstance(conversation, str):
+            conversation = json.loads(conversation)
+        if isinstance(conversation, list):
+            conversation = {"messages": conversation}
+        conversation = ConversationModel.model_validate(conversation)
+
+        answer, candidates = self.chat_client.prefilter_issues(self.issues, conversation)
+        if answer is not None:
+            self._local_results.write(json.dumps({"id": record["id"], "found_issue": answer[0], "issue_id": answer[1]}) + "\n")
+            return None
+        return self.chat_client.find_issue_prompt(candidates, conversation)
+
+    def prepare(self) -> None:
+        """
+        Streams the input into shard files. Shards are rebuilt from scratch unless a previous run finished
+        writing all of them, since nothing has been submitted before that point.
+        """
+        if self.checkpoint.state["prepared"]:
+            return
+
+        os.makedirs(self.work_dir, exist_ok=True)
+        shards: List[Dict[str, Any]] = []
+        shard_file = None
+        seen_ids = set()
+        self._local_results = open(os.path.join(self.work_dir, "local_results.jsonl"), "w", encoding="utf-8")
+        try:
+            for number, record in enumerate(iter_records(self.args.input), start=1):
+                # An empty CSV cell counts as no id; an explicit 0 is kept
+                if record.get("id") is not None and record["id"] != "":
+                    record["id"] = str(record["id"])
+                else:
+                    record["id"] = f"line-{number}"
+                if record["id"] in seen_ids:
+                    raise ValueError(f"Duplicate id {record['id']!r} in {self.args.input} (record {number})")
+                seen_ids.add(record["id"])
+                prompt = self._prompt_for(record)
+                if prompt is None:
+                    continue
+
+                if shard_file is None or shards[-1]["requests"] >= self.args.shard_size:
+                    if shard_file is not None:
+                        shard_file.close()
+                    path = os.path.join(self.work_dir, f"shard-{len(shards):05d}.jsonl")
+                    shards.append({"path": path, "requests": 0, "status": "prepared"})
+                    shard_file = open(path, "w", encoding="utf-8")
+
+                shard_file.write(self._request_line(record["id"], prompt) + "\n")
+                shards[-1]["requests"] += 1
+        finally:
+            if shard_file is not None:
+                shard_file.close()
+            self._local_results.close()
+
+        # Results are appended after whatever the output already holds, which a resumed run must not cut off
+        output_size = os.path.getsize(self.args.output) if os.path.exists(self.args.output) else 0
+        self.checkpoint.state.update(prepared=True, local_written=False, output_size=output_size, shards=shards)
+        self.checkpoint.save()
+        print(f"Prepared {sum(shard['requests'] for shard in shards)} requests in {len(shards)} shards")
+
+    async def submit(self, shard: Dict[str, Any]) -> None:
+        if "file_id" not in shard:
+            with open(shard["path"], "rb") as f:
+                uploaded = await self.client.files.create(file=f, purpose="batch")
+            shard["file_id"] = uploaded.id
+            self.checkpoint.save()
+
+        if "batch_id" not in shard:
+            batch = await self.client.batches.create(
+                input_file_id=shard["file_id"],
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW,
+            )
+            shard["batch_id"] = batch.id
+            shard["status"] = batch.status
+            self.checkpoint.save()
+            print(f"Submitted {shard['path']} as batch {batch.id}")
+
+    async def refresh(self, shard: Dict[str, Any]) -> None:
+        batch = await self.client.batches.retrieve(shard["batch_id"])
+        if batch.status != shard["status"]:
+            print(f"Batch {batch.id}: {batch.status}")
+        shard["status"] = batch.status
+        shard["output_file_id"] = batch.output_file_id
+        shard["error_file_id"] = batch.error_file_id
+        self.checkpoint.save()
+
+    def _result_line(self, line: str) -> str:
+        result = json.loads(line)
+        custom_id = result["custom_id"]
+        response = result.get("response") or {}
+        error = result.get("error")
+        if error is None and response.get("status_code", 200) >= 400:
+            error = (response.get("body") or {}).get("error") or {"status_code": response["status_code"]}
+        if error is not None:
+            return json.dumps({"id": custom_id, "error": error})
+
+        content = response["body"]["choices"][0]["message"]["content"] or ""
+        if self.args.mode == "generate":
+            return json.dumps({"id": custom_id, "response": content})
+        issue_id = ChatClient.parse_issue_id(content, self.issues)
+        return json.dumps({"id": custom_id, "found_issue": issue_id is not None, "issue_id": issue_id})
+
+    async def _stream_file(self, file_id: str, output) -> None:
+        async with self.client.files.with_streaming_response.content(file_id) as response:
+            async for line in response.iter_lines():
+                if line.strip():
+                    output.write(self._result_line(line) + "\n")
+
+    async def write_results(self, shard: Dict[str, Any], output) -> None:
+        for file_id in (shard.get("output_file_id"), shard.get("error_file_id")):
+            if file_id:
+                await self._stream_file(file_id, output)
+        if shard["status"] != "completed":
+            output.write(json.dumps({"shard": shard["path"], "batch_id": shard["batch_id"], "error": shard["status"]}) + "\n")
+
+    def _commit_output(self, output) -> None:
+        output.flush()
+        os.fsync(output.fileno())
+        self.checkpoint.state["output_size"] = output.tell()
+        self.checkpoint.save()
+
+    async def run(self) -> bool:
+        """
+        Runs the job to completion, or until every shard is submitted when --no-wait is set.
+        Returns True once every result has been written out.
+        """
+        self.prepare()
+        for shard in self.checkpoint.shards:
+            await self.submit(shard)
+
+        # Drop whatever a crashed run wrote after the last shard it finished
+        if os.path.exists(self.args.output):
+            os.truncate(self.args.output, self.checkpoint.state["output_size"])
+
+        with open(self.args.output, "a", encoding="utf-8") as output:
+            if not self.checkpoint.state["local_written"]:
+                with open(os.path.join(self.work_dir, "local_results.jsonl"), encoding="utf-8") as local_results:
+                    for line in local_results:
+                        output.write(line)
+                self.checkpoint.state["local_written"] = True
+                self._commit_output(output)
+
+            while True:
+                pending = [shard for shard in self.checkpoint.shards if shard["status"] != "written"]
+                if not pending:
+                    return True
+
+                for shard in pending:
+                    if shard["status"] not in BATCH_FINAL_STATUSES:
+                        await self.refresh(shard)
+                    if shard["status"] in BATCH_FINAL_STATUSES:
+                        await self.write_results(shard, output)
+                        shard["status"] = "written"
+                        self._commit_output(output)
+
+                if self.args.no_wait:
+                    waiting = sum(shard["status"] != "written" for shard in self.checkpoint.shards)
+                    print(f"{waiting} batches still running; re-run the same command to collect them")
+                    return waiting == 0
+                if any(shard["status"] != "written" for shard in self.checkpoint.shards):
+                    await asyncio.sleep(self.args.poll_interval)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk generation through the OpenAI Batch API")
+    parser.add_argument("input", help="JSONL or CSV file with one record per prompt")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--mode", choices=MODES, default="generate")
+    parser.add_argument("--model", default=OpenAIModel.GPT_3_5.value, choices=[model.value for model in OpenAIModel])
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--max-tokens", type=int, default=250)
+    parser.add_argument("--issues", help="JSON list of issues for --mode find-issue (defaults to the built-in issues)")
+    parser.add_argument("--shard-size", type=int, default=BATCH_MAX_SHARD_SIZE)
+    parser.add_argument("--work-dir", help="Directory for shard files (defaults to <output>.work)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to <work-dir>/checkpoint.json)")
+    parser.add_argument("--poll-interval", type=float, default=60)
+    parser.add_argument("--no-wait", action="store_true", help="Submit, collect whatever is finished and exit")
+    parser.add_argument("--base-url", help="API base URL, e.g. a local stand-in server")
+    args = parser.parse_args(argv)
+    args.shard_size = max(1, min(args.shard_size, BATCH_MAX_SHARD_SIZE))
+    return args
+
+
+async def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=args.base_url)
+    started_at = time.perf_counter()
+    try:
+        finished = await BulkJob(args, client).run()
+    finally:
+        await client.close()
+    if finished:
+        print(f"Done in {time.perf_counter() - started_at:.1f}s, results in {args.output}")
+    return 0 if finished else 2
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -2,16 +2,104 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import os
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from routes.generate import router as text_generation_router
 from routes.ws.generate import router as text_generation_ws_router
 from routes.ws.gpts import router as gpts_ws_router
 from routes.chat import router as chat_router
+from routes.metrics import router as metrics_router
+from routes.debug import router as debug_router
+from app.services.chat_client import get_chat_client
+from app.services.client_registry import client_registry
+from app.services.completion_cache import close_completion_cache
+from app.services.gpts_client import get_gpts_client
+from app.services.loop_monitor import start_loop_monitor, stop_loop_monitor
+from app.services.metrics import HTTP_REQUEST_SECONDS
+from app.services.openai_client import close_async_openai, get_openai_client, warm_async_openai
+from app.services.request_context import PRIORITY_BATCH, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE, current_route, request_priority
+
+DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "0") == "1"
+
+# Upstream queue priority by path prefix; the first match wins
+ROUTE_PRIORITIES = [
+    ("/chat/find-issue/batch", PRIORITY_BATCH),
+    ("/chat", PRIORITY_INTERACTIVE),
+    ("/ws", PRIORITY_INTERACTIVE),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared clients once and open the upstream connection before taking traffic
+    await warm_async_openai()
+    get_openai_client()
+    get_chat_client()
+    get_gpts_client()
+    start_loop_monitor()
+    yield
+    await stop_loop_monitor()
+    client_registry.clear()
+    await close_async_openai()
+    close_completion_cache()
+
+def route_priority(path: str) -> int:
+    for prefix, priority in ROUTE_PRIORITIES:
+        if path.startswith(prefix):
+            return priority
+    return PRIORITY_DEFAULT
+
+class RouteContextMiddleware:
+    # Lets the services label their per-route statistics (e.g. completion cache hits) with the request path,
+    # sets the priority the request's upstream calls get in the rate limiter queue, and times HTTP requests
+    def __init__(self, app):
+        self.app = app
 
-app = FastAPI()
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ["http", "websocket"]:
+            return await self.app(scope, receive, send)
+
+        route_token = current_route.set(scope["path"])
+        priority_token = request_priority.set(route_priority(scope["path"]))
+        try:
+            if scope["type"] == "http":
+                await self.timed(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            request_priority.reset(priority_token)
+            current_route.reset(route_token)
+
+    async def timed(self, scope, receive, send):
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by the route template the router matched, so unknown paths cannot blow up the label set
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started_at, route, scope["method"], str(status))
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RouteContextMiddleware)
 
 # Include the routes from the routes directory
 app.include_router(text_generation_router, tags=["Text Generation"])
 app.include_router(text_generation_ws_router, tags=["Text Generation (WebSockets)"])
 app.include_router(gpts_ws_router, tags=["GPT Assistants (WebSockets)"])
 app.include_router(chat_router, tags=["Chat"])
+app.include_router(metrics_router, tags=["Metrics"])
+
+# Stall reports and the sampling profiler expose stacks and file paths, so they are opt-in
+if DEBUG_ENDPOINTS_ENABLED:
+    app.include_router(debug_router, tags=["Debug"])
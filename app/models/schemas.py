@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class Role(str, Enum):
@@ -20,13 +20,33 @@ class ConversationModel(BaseModel):
     messages: List[Message]
 
     
+# Issues are sent inline or as the id of a catalogue registered through /chat/issue-catalogs
 class FindIssueRequest(BaseModel):
     conversation: ConversationModel
-    issues: List[Issue]
+    issues: Optional[List[Issue]] = None
+    issue_catalog_id: Optional[str] = None
     
 class FindIssueResponse(BaseModel):
     found_issue: bool
-    issue_id: str = None
+    issue_id: Optional[str] = None
+
+class FindIssueBatchRequest(BaseModel):
+    conversations: List[ConversationModel]
+    issues: Optional[List[Issue]] = None
+    issue_catalog_id: Optional[str] = None
+
+class IssueCatalogResponse(BaseModel):
+    issue_catalog_id: str
+    issue_count: int
+
+class FindIssueBatchResponse(BaseModel):
+    results: List[FindIssueResponse]
+
+class ConversationRequest(BaseModel):
+    conversation: ConversationModel
+
+class ConversationResponse(BaseModel):
+    response: str
     
 class SingleRequestModel(BaseModel):
     prompt: str
@@ -39,7 +59,11 @@ class ServerAndUserMessageModel(BaseModel):
     user_prompt: str
     
 
+# The upstream models are read straight from the SDK objects' attributes with model_validate(), instead of
+# dumping them to a dict first and validating that
 class Assistant(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str = Field(..., alias='id')
     object: str
     created_at: int
@@ -50,13 +74,25 @@ class Assistant(BaseModel):
     tools: List[Any]
     file_ids: List[str]
     metadata: Dict[str, Any]
+
+    @field_validator("tools", mode="before")
+    @classmethod
+    def tools_as_dicts(cls, tools: Any) -> Any:
+        # Tools stay plain dicts, as they are passed back to the SDK when the assistant is updated
+        if not isinstance(tools, list):
+            return tools
+        return [tool.model_dump() if isinstance(tool, BaseModel) else tool for tool in tools]
     
 class DeletionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str = Field(..., alias='id')
     object: str
     deleted: bool
     
 class FileObject(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str = Field(..., alias='id')
     object: str
     created_at: int
@@ -1,9 +1,36 @@
-from fastapi import APIRouter, Depends
-from app.models.schemas import FindIssueRequest, FindIssueResponse, Role
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from app.models.schemas import ConversationRequest, ConversationResponse, FindIssueBatchRequest, FindIssueBatchResponse, FindIssueRequest, FindIssueResponse, Issue, IssueCatalogResponse, Role
+from app.routes.errors import upstream_http_exception
 from app.services.chat_client import ChatClient, get_chat_client
+from app.services.issue_catalog import issue_catalog
 
 router = APIRouter(prefix="/chat")
 
+def resolve_issues(issues: Optional[List[Issue]], issue_catalog_id: Optional[str]) -> Optional[List[Issue]]:
+    # Inline issues win; otherwise the registered catalogue is used, and with neither the client's defaults apply
+    if issues is not None or issue_catalog_id is None:
+        return issues
+    catalog = issue_catalog.get(issue_catalog_id)
+    if catalog is None:
+        raise HTTPException(status_code=404, detail=f"Unknown issue catalogue {issue_catalog_id}; register it again through /chat/issue-catalogs")
+    return catalog
+
+@router.post("/issue-catalogs")
+async def register_issue_catalog(issues: List[Issue]) -> IssueCatalogResponse:
+    """
+    This endpoint registers a list of known issues once, so that find-issue requests can refer to it by id instead of
+    sending (and having the server validate) the full list every time.
+
+    The id is a hash of the issues' content: registering the same list again returns the same id, in every server
+    process, so clients can keep using an id across restarts and re-register only when a request returns 404.
+
+    Returns:
+    - An IssueCatalogResponse object with the catalogue id to pass as 'issue_catalog_id' and the number of issues.
+    """
+    return IssueCatalogResponse(issue_catalog_id=issue_catalog.register(issues), issue_count=len(issues))
+
 @router.post("/find-issue")
 async def find_issue(
     request: FindIssueRequest,
@@ -15,6 +42,7 @@ async def find_issue(
     Parameters:
     - request: a FindIssueRequest object containing the user's conversation and a list of potential issues. 
       The conversation is represented as a sequence of messages, and issues are defined with specific identifiers and descriptions.
+      Instead of the list, 'issue_catalog_id' may name a list registered through /chat/issue-catalogs.
     - chat_client: an instance of ChatClient, which provides the functionality to analyze the conversation and find 
       a matching issue. This instance is obtained through dependency injection.
 
@@ -28,7 +56,35 @@ async def find_issue(
     Returns:
     - A FindIssueResponse object containing a boolean indicating whether a matching issue was found and the identifier of the found issue (if applicable).
     """
-    pass  # Implement here. 
+    issues = resolve_issues(request.issues, request.issue_catalog_id)
+    try:
+        found_issue, issue_id = await chat_client.find_issue(issues=issues, conversation=request.conversation)
+        return FindIssueResponse(found_issue=found_issue, issue_id=issue_id)
+    except Exception as e:
+        raise upstream_http_exception(e)
+
+@router.post("/find-issue/batch")
+async def find_issue_batch(
+    request: FindIssueBatchRequest,
+    chat_client: ChatClient = Depends(get_chat_client)
+) -> FindIssueBatchResponse:
+    """
+    This endpoint classifies many conversations against one list of known issues in a single request.
+
+    Conversations are grouped into batched prompts that are processed concurrently, and identical conversations
+    are only classified once. The results are returned in the same order as the input conversations.
+
+    Returns:
+    - A FindIssueBatchResponse object with one FindIssueResponse per input conversation.
+    """
+    issues = resolve_issues(request.issues, request.issue_catalog_id)
+    try:
+        results = await chat_client.find_issues_batch(conversations=request.conversations, issues=issues)
+        return FindIssueBatchResponse(results=[
+            FindIssueResponse(found_issue=found_issue, issue_id=issue_id) for found_issue, issue_id in results
+        ])
+    except Exception as e:
+        raise upstream_http_exception(e)
 
 @router.post("/conversation")
 async def process_conversation(
@@ -56,7 +112,11 @@ async def process_conversation(
     Returns:
     - A ConversationResponse object containing the generated response to the user's conversation.
     """
-    pass  # The actual functionality is omitted for brevity.
+    try:
+        response = await chat_client.conversation_response(conversation=request.conversation)
+        return ConversationResponse(response=response)
+    except Exception as e:
+        raise upstream_http_exception(e)
 
 
     
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.services.loop_monitor import get_loop_monitor
+from app.services.profiler import PROFILE_MAX_SECONDS, collapsed, profiler
+
+router = APIRouter(prefix="/debug")
+
+
+#####################
+# EVENT LOOP HEALTH #
+#####################
+
+
+@router.get("/loop")
+async def loop_health():
+    """
+    Recent event loop stalls longer than the monitor's threshold, each with the stack the loop was blocked in.
+    """
+    monitor = get_loop_monitor()
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="The loop monitor is disabled (enable it with LOOP_MONITOR_ENABLED=1)")
+    return monitor.snapshot()
+
+
+#####################
+# SAMPLING PROFILER #
+#####################
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    loop_only: bool = Query(False, description="Sample only the event loop thread")
+) -> PlainTextResponse:
+    """
+    Samples every thread's stack for the given number of seconds and returns the profile as collapsed stacks,
+    ready for flamegraph.pl or speedscope:
+
+        curl 'localhost:8000/debug/profile?seconds=10' > profile.folded
+    """
+    # Handlers run on the event loop thread
+    thread_id = threading.get_ident() if loop_only else None
+    try:
+        # The sampler sleeps between samples, so run it off the loop it is watching
+        stacks = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000, thread_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed(stacks))
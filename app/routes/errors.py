@@ -0,0 +1,22 @@
+import openai
+from fastapi import HTTPException
+
+from app.services.rate_limiter import parse_retry_after
+
+
+def upstream_http_exception(e: Exception) -> HTTPException:
+    """
+    Maps an error from the upstream call to the HTTP error the route should return: rate limits become 429
+    with a Retry-After hint, upstream failures and timeouts become 502/504, everything else stays a 500.
+    """
+    if isinstance(e, openai.RateLimitError):
+        retry_after = parse_retry_after(e.response.headers)
+        headers = {"Retry-After": str(max(1, round(retry_after)))} if retry_after is not None else None
+        return HTTPException(status_code=429, detail=str(e), headers=headers)
+    if isinstance(e, openai.APITimeoutError):
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, openai.APIConnectionError):
+        return HTTPException(status_code=502, detail=str(e))
+    if isinstance(e, openai.APIStatusError) and e.status_code >= 500:
+        return HTTPException(status_code=502, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
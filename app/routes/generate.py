@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 from app.models.schemas import ChatCompletionResponse, ConversationModel, ServerAndUserMessageModel, SingleRequestModel
-from services.openai_client import OpenAIClient, get_openai_client
+from app.routes.errors import upstream_http_exception
+from app.routes.sse import sse_response
+from app.services.openai_client import OpenAIClient, get_default_openai_client
 
 router = APIRouter(prefix="/generate")
 
@@ -13,13 +16,13 @@ router = APIRouter(prefix="/generate")
 @router.post("/single", response_model=ChatCompletionResponse)
 async def single_response(
     request: SingleRequestModel, 
-    openai_client: OpenAIClient = Depends(get_openai_client)
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
 ) -> ChatCompletionResponse:
     try:
-        generated_text = openai_client.single_response(prompt=request.prompt)
+        generated_text = await openai_client.single_response(prompt=request.prompt)
         return ChatCompletionResponse(response=generated_text)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_http_exception(e)
 
 
 #################################
@@ -30,16 +33,16 @@ async def single_response(
 @router.post("/server-and-user", response_model=ChatCompletionResponse)
 async def server_and_user_message_response(
     request: ServerAndUserMessageModel,
-    openai_client: OpenAIClient = Depends(get_openai_client)
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
 ) -> ChatCompletionResponse:
     try:
-        generated_text = openai_client.server_and_user_message_response(
+        generated_text = await openai_client.server_and_user_message_response(
             server_prompt=request.server_prompt, 
             user_prompt=request.user_prompt
         )
         return ChatCompletionResponse(response=generated_text)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_http_exception(e)
     
     
 ######################
@@ -50,10 +53,55 @@ async def server_and_user_message_response(
 @router.post("/conversation", response_model=ChatCompletionResponse)
 async def conversation_response(
     request: ConversationModel,
-    openai_client: OpenAIClient = Depends(get_openai_client)
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
 ) -> ChatCompletionResponse:
     try:
-        generated_text = openai_client.conversation_response(messages=request.messages)
+        generated_text = await openai_client.conversation_response(
+            messages=[message.model_dump(mode="json") for message in request.messages]
+        )
         return ChatCompletionResponse(response=generated_text)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise upstream_http_exception(e)
+
+
+########################
+# STREAMING SSE ROUTES #
+########################
+
+
+@router.post("/single/stream")
+async def single_response_stream(
+    request: SingleRequestModel,
+    http_request: Request,
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
+) -> StreamingResponse:
+    return sse_response(http_request, openai_client.single_response_stream(prompt=request.prompt))
+
+
+@router.post("/server-and-user/stream")
+async def server_and_user_message_response_stream(
+    request: ServerAndUserMessageModel,
+    http_request: Request,
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
+) -> StreamingResponse:
+    return sse_response(
+        http_request,
+        openai_client.server_and_user_message_response_stream(
+            server_prompt=request.server_prompt,
+            user_prompt=request.user_prompt
+        )
+    )
+
+
+@router.post("/conversation/stream")
+async def conversation_response_stream(
+    request: ConversationModel,
+    http_request: Request,
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
+) -> StreamingResponse:
+    return sse_response(
+        http_request,
+        openai_client.conversation_response_stream(
+            messages=[message.model_dump(mode="json") for message in request.messages]
+        )
+    )
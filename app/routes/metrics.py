@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.services.metrics import CONTENT_TYPE, metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    """
+    Prometheus text exposition of the per-route and per-client-method histograms and the completion cache counters.
+    """
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,67 @@
+import asyncio
+from typing import AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from app.services.json_codec import dumps
+
+SSE_HEARTBEAT_INTERVAL = 15.0
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Stop nginx-style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {dumps(data)}\n\n"
+
+
+async def sse_events(request: Request, tokens: AsyncIterator[str], heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL) -> AsyncIterator[str]:
+    """
+    Turns a token generator into Server-Sent Events. Each delta is flushed as its own event, a comment
+    line is sent whenever the upstream is quiet for heartbeat_interval seconds, and the token generator
+    is closed (cancelling the upstream request) as soon as the client disconnects.
+    """
+    next_token = None
+    try:
+        while True:
+            if next_token is None:
+                next_token = asyncio.ensure_future(tokens.__anext__())
+
+            done, _ = await asyncio.wait({next_token}, timeout=heartbeat_interval)
+
+            if await request.is_disconnected():
+                return
+
+            if not done:
+                yield ": heartbeat\n\n"
+                continue
+
+            try:
+                token = next_token.result()
+            except StopAsyncIteration:
+                yield format_sse({}, event="done")
+                return
+            except Exception as e:
+                yield format_sse({"detail": str(e)}, event="error")
+                return
+            finally:
+                next_token = None
+
+            yield format_sse({"delta": token})
+    finally:
+        if next_token is not None:
+            next_token.cancel()
+            try:
+                await next_token
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        await tokens.aclose()
+
+
+def sse_response(request: Request, tokens: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(sse_events(request, tokens), media_type="text/event-stream", headers=SSE_HEADERS)
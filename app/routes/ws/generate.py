@@ -0,0 +1,80 @@
+import time
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import APIRouter, Depends, WebSocket
+from pydantic import ValidationError
+from app.models.schemas import ConversationModel, ServerAndUserMessageModel, SingleRequestModel
+from app.routes.ws.session import StreamSession
+from app.services.openai_client import OpenAIClient, get_default_openai_client
+
+router = APIRouter(prefix="/ws")
+
+
+def open_stream(openai_client: OpenAIClient, message: Dict[str, Any], on_first_token) -> AsyncIterator[str]:
+    message_type = message.get("type")
+
+    if message_type == "single":
+        request = SingleRequestModel.model_validate(message)
+        return openai_client.single_response_stream(prompt=request.prompt, on_first_token=on_first_token)
+
+    if message_type == "server_and_user":
+        request = ServerAndUserMessageModel.model_validate(message)
+        return openai_client.server_and_user_message_response_stream(
+            server_prompt=request.server_prompt,
+            user_prompt=request.user_prompt,
+            on_first_token=on_first_token
+        )
+
+    if message_type == "conversation":
+        request = ConversationModel.model_validate(message)
+        return openai_client.conversation_response_stream(
+            messages=[item.model_dump(mode="json") for item in request.messages],
+            on_first_token=on_first_token
+        )
+
+    raise ValueError(f"Unknown message type: {message_type}")
+
+
+##########################
+# TEXT GENERATION SOCKET #
+##########################
+
+
+@router.websocket("/generate")
+async def generate_socket(
+    websocket: WebSocket,
+    openai_client: OpenAIClient = Depends(get_default_openai_client)
+):
+    """
+    Streams completions over a single socket. Send {"request_id", "type": "single" | "server_and_user" |
+    "conversation", ...fields of the matching request model}; the server answers with "delta" messages
+    followed by "done" (with the time-to-first-token), "error" or "cancelled", all tagged with the request_id.
+    """
+
+    async def handle(session: StreamSession, message: Dict[str, Any]) -> None:
+        request_id = message["request_id"]
+
+        async def work() -> None:
+            timings = {}
+
+            def on_first_token(ttft: float) -> None:
+                timings["ttft"] = ttft
+
+            try:
+                tokens = open_stream(openai_client, message, on_first_token)
+            except (ValidationError, ValueError) as e:
+                await session.send(request_id, "error", detail=str(e))
+                return
+
+            started_at = time.perf_counter()
+            try:
+                async for token in tokens:
+                    await session.send(request_id, "delta", content=token)
+            finally:
+                await tokens.aclose()
+
+            await session.send(request_id, "done", ttft=timings.get("ttft"), duration=time.perf_counter() - started_at)
+
+        await session.start(request_id, work)
+
+    await StreamSession(websocket).serve(handle)
@@ -0,0 +1,77 @@
+import asyncio
+import uuid
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, WebSocket
+from app.routes.ws.session import StreamSession
+from app.services.gpts_client import GPTSClient, get_gpts_client
+
+router = APIRouter(prefix="/ws")
+
+TOOL_OUTPUT_TIMEOUT = 60.0
+
+
+#########################
+# GPT ASSISTANTS SOCKET #
+#########################
+
+
+@router.websocket("/gpts")
+async def gpts_socket(
+    websocket: WebSocket,
+    gpts_client: GPTSClient = Depends(get_gpts_client)
+):
+    """
+    Runs assistant threads over a single socket. Send {"request_id", "assistant_id", "type": "single" |
+    "server_and_user" | "conversation", ...}; conversation messages may carry a "conversation_id" so follow-up turns
+    reuse the same assistant thread. When the run needs a tool, the server sends a "tool_call"
+    message ({"call_id", "name", "arguments"}) and waits for the client to reply with {"type": "tool_output",
+    "request_id", "call_id", "output"}. The run ends with a "result", "error" or "cancelled" message.
+    """
+    pending_tool_calls: Dict[str, asyncio.Future] = {}
+
+    async def handle(session: StreamSession, message: Dict[str, Any]) -> None:
+        request_id = message["request_id"]
+        message_type = message.get("type")
+
+        if message_type == "tool_output":
+            future = pending_tool_calls.get(message.get("call_id"))
+            if future is not None and not future.done():
+                future.set_result(message.get("output", ""))
+            return
+
+        async def callback(function_name: str, args: Dict[str, Any]) -> str:
+            call_id = uuid.uuid4().hex
+            future = asyncio.get_running_loop().create_future()
+            pending_tool_calls[call_id] = future
+            try:
+                await session.send(request_id, "tool_call", call_id=call_id, name=function_name, arguments=args)
+                return await asyncio.wait_for(future, timeout=TOOL_OUTPUT_TIMEOUT)
+            finally:
+                pending_tool_calls.pop(call_id, None)
+
+        async def work() -> None:
+            assistant_id = message.get("assistant_id")
+            if not assistant_id:
+                await session.send(request_id, "error", detail="assistant_id is required")
+                return
+
+            if message_type == "single":
+                result = await gpts_client.single_response(assistant_id, message["prompt"], callback)
+            elif message_type == "server_and_user":
+                result = await gpts_client.server_and_user_message_response(
+                    assistant_id, message["server_prompt"], message["user_prompt"], callback
+                )
+            elif message_type == "conversation":
+                result = await gpts_client.conversation_response(
+                    assistant_id, message["messages"], callback, conversation_id=message.get("conversation_id")
+                )
+            else:
+                await session.send(request_id, "error", detail=f"Unknown message type: {message_type}")
+                return
+
+            await session.send(request_id, "result", content=result)
+
+        await session.start(request_id, work)
+
+    await StreamSession(websocket).serve(handle)
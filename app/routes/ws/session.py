@@ -0,0 +1,120 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+from app.services.json_codec import dumps, loads
+
+WS_MAX_CONCURRENT_STREAMS = 16
+WS_SEND_QUEUE_SIZE = 64
+
+RequestId = Union[str, int]
+
+
+class StreamSession:
+    """
+    Multiplexes several generation requests over one WebSocket.
+
+    Every client message carries a 'request_id'. Each request runs in its own task and all of them write
+    into one bounded outbox drained by a single writer task; when the client reads slowly the outbox fills
+    up and the producers stop pulling from the upstream until there is room again (backpressure).
+    A {"type": "cancel", "request_id": ...} message cancels that request only.
+    """
+
+    def __init__(self, websocket: WebSocket, max_streams: int = WS_MAX_CONCURRENT_STREAMS, send_queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.max_streams = max_streams
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self.tasks: Dict[RequestId, asyncio.Task] = {}
+        self._closing = False
+
+    async def send(self, request_id: Optional[RequestId], type: str, **payload: Any) -> None:
+        await self.outbox.put({"request_id": request_id, "type": type, **payload})
+
+    async def _send_final(self, request_id: RequestId, type: str, **payload: Any) -> None:
+        # Waits for room in the outbox like any other message, so a slow client still learns that the request
+        # ended; only skipped once the socket is being torn down and nobody is left to read it
+        if not self._closing:
+            await self.send(request_id, type, **payload)
+
+    async def start(self, request_id: RequestId, work: Callable[[], Awaitable[None]]) -> None:
+        if request_id in self.tasks:
+            await self.send(request_id, "error", detail="request_id is already in use")
+            return
+        if len(self.tasks) >= self.max_streams:
+            await self.send(request_id, "error", detail=f"Too many concurrent requests (max {self.max_streams})")
+            return
+        self.tasks[request_id] = asyncio.ensure_future(self._run(request_id, work))
+
+    def cancel(self, request_id: RequestId) -> None:
+        task = self.tasks.get(request_id)
+        if task is not None:
+            task.cancel()
+
+    async def _run(self, request_id: RequestId, work: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await work()
+        except asyncio.CancelledError:
+            await self._send_final(request_id, "cancelled")
+        except Exception as e:
+            await self._send_final(request_id, "error", detail=str(e))
+        finally:
+            self.tasks.pop(request_id, None)
+
+    async def _writer(self) -> None:
+        while True:
+            message = await self.outbox.get()
+            if self._closing:
+                continue
+            try:
+                await self.websocket.send_text(dumps(message))
+            except Exception:
+                # The client is gone: keep draining so nothing waits on the outbox until the receive loop notices
+                self._closing = True
+
+    async def _receive(self) -> Union[str, bytes]:
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        text = message.get("text")
+        return text if text is not None else message.get("bytes", b"")
+
+    async def serve(self, handle: Callable[["StreamSession", Dict[str, Any]], Awaitable[None]]) -> None:
+        """
+        Accepts the socket and dispatches incoming messages to handle(session, message) until the client
+        disconnects, then cancels everything still in flight. A malformed message is answered with an error
+        (without a request_id) and does not affect the other requests on the socket.
+        """
+        await self.websocket.accept()
+        writer = asyncio.ensure_future(self._writer())
+        try:
+            while True:
+                data = await self._receive()
+                try:
+                    message = loads(data)
+                except ValueError:
+                    await self.send(None, "error", detail="Messages must be JSON objects")
+                    continue
+
+                request_id = message.get("request_id") if isinstance(message, dict) else None
+                if not isinstance(request_id, (str, int)) or isinstance(request_id, bool):
+                    await self.send(None, "error", detail="Every message needs a request_id (a string or a number)")
+                    continue
+
+                if message.get("type") == "cancel":
+                    self.cancel(request_id)
+                    continue
+
+                try:
+                    await handle(self, message)
+                except Exception as e:
+                    await self.send(request_id, "error", detail=str(e))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closing = True
+            tasks = list(self.tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
@@ -1,14 +1,24 @@
 # chat_client.py
 
+import asyncio
 from enum import Enum
+import hashlib
 import os
-from typing import List, Optional, Tuple
-from app.models.schemas import ConversationModel, Issue, Role
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.models.schemas import ConversationModel, Issue, Message, Role
 
+from app.services.client_registry import client_registry
+from app.services.context_window import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+from app.services.issue_catalog import catalog_id
+from app.services.issue_index import IssueIndex
+from app.services.metrics import PROMPT_BUILD_SECONDS, instrumented
+from app.services.prompt_builder import CompiledTemplate, PromptBuilder
 from app.services.openai_client import get_openai_client
+from app.services.ttl_cache import TTLCache
 
 def get_chat_client():
-    return ChatClient()
+    return client_registry.get_or_create(("chat",), ChatClient)
 
 class OpenAIModel(str, Enum):
     GPT_3 = "gpt-3.5-turbo"
@@ -28,6 +38,40 @@ Here are your options. Remember to pick the one that most closely matches the co
 Which issueID will you pick? Remember, NONE is an option as well. 
 """
 
+FIND_ISSUE_BATCH_PROMPT = """
+NO MATTER WHAT, YOUR ONLY JOB IS TO OUTPUT, FOR EACH NUMBERED CONVERSATION, THE ISSUE ID OF THE ISSUE THAT MOST CLOSELY MATCHES IT. \
+IF NO ISSUE MATCHES A CONVERSATION, THEN YOU SHOULD OUTPUT "NONE" FOR IT. OUTPUT EXACTLY ONE LINE PER CONVERSATION, \
+IN THE FORM "<conversation number>: <issue id or NONE>", AND NOTHING ELSE.
+
+Here are your options. Remember to pick the one that most closely matches each conversation. If none match, then output "NONE". \
+{issues}
+
+Here are the conversations:
+{conversations}
+"""
+
+FIND_ISSUE_TEMPLATE = CompiledTemplate(FIND_ISSUE_PROMPT)
+FIND_ISSUE_BATCH_TEMPLATE = CompiledTemplate(FIND_ISSUE_BATCH_PROMPT)
+
+# Batched classification settings for find_issues_batch
+FIND_ISSUE_BATCH_SIZE = int(os.getenv("FIND_ISSUE_BATCH_SIZE", "10"))
+FIND_ISSUE_BATCH_CONCURRENCY = int(os.getenv("FIND_ISSUE_BATCH_CONCURRENCY", "4"))
+FIND_ISSUE_TOKENS_PER_CONVERSATION = 12
+# Allowance for the "CONVERSATION n:" header and separator around each transcript in a batched prompt
+FIND_ISSUE_BATCH_TOKENS_PER_HEADER = 8
+
+# Local issue prefilter: only the top-k most similar issues go into the prompt. The similarity is lexical, so it
+# only decides the answer on its own (above the match / below the no-match threshold) when ISSUE_PREFILTER_DECIDES=1;
+# by default the model always answers, and a conversation with no lexical overlap is shown every issue
+ISSUE_PREFILTER_TOP_K = int(os.getenv("ISSUE_PREFILTER_TOP_K", "8"))
+ISSUE_PREFILTER_DECIDES = os.getenv("ISSUE_PREFILTER_DECIDES", "0") == "1"
+ISSUE_MATCH_THRESHOLD = float(os.getenv("ISSUE_MATCH_THRESHOLD", "0.9"))
+ISSUE_NO_MATCH_THRESHOLD = float(os.getenv("ISSUE_NO_MATCH_THRESHOLD", "0.05"))
+# One index per distinct issue list (keyed by its catalogue hash), so lists that reuse issue ids never mix
+ISSUE_INDEX_CACHE_SIZE = int(os.getenv("ISSUE_INDEX_CACHE_SIZE", "64"))
+
+BATCH_ANSWER_PATTERN = re.compile(r"^\s*(?:CONVERSATION\s*)?(\d+)\s*[:.)\-]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+
 DEFAULT_ISSUES = [
     Issue(
         issue_id="1",
@@ -59,8 +103,82 @@ class ChatClient:
         self.conversation = conversation or ConversationModel(messages=[])
         self.model = model
         self.openai_client = get_openai_client(model=self.model)
-        
-    def find_issue(self, issues: List[Issue] = None, conversation: ConversationModel = None) -> Tuple[bool, Optional[str]]:
+        # Issue classification is deterministic, which also lets the completion cache serve repeated prompts
+        self.classifier_client = get_openai_client(model=self.model, temperature=0)
+        # Upstream calls currently in flight, keyed by prompt fingerprint, so identical requests share one call
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._issue_indexes: TTLCache[IssueIndex] = TTLCache(maxsize=ISSUE_INDEX_CACHE_SIZE)
+        self.issue_index(self.issues)
+        self.prompts = PromptBuilder()
+
+    @staticmethod
+    def parse_issue_id(response: str, issues: List[Issue]) -> Optional[str]:
+        # Pick the known issue id mentioned first in the response, if any
+        best_position, best_id = None, None
+        for issue in issues:
+            match = re.search(rf"(?<![\w-]){re.escape(issue.issue_id)}(?![\w-])", response)
+            if match and (best_position is None or match.start() < best_position):
+                best_position, best_id = match.start(), issue.issue_id
+        return best_id
+
+    def issue_index(self, issues: List[Issue]) -> IssueIndex:
+        key = catalog_id(issues)
+        index = self._issue_indexes.get(key)
+        if index is None:
+            index = IssueIndex(issues)
+            self._issue_indexes.set(key, index)
+        return index
+
+    def prefilter_issues(self, issues: List[Issue], conversation: ConversationModel, index: IssueIndex = None) -> Tuple[Optional[Tuple[bool, Optional[str]]], List[Issue]]:
+        """
+        Ranks the issues against the user's messages with the local issue index. Returns (answer, candidates):
+        answer is only set when ISSUE_PREFILTER_DECIDES is on and the similarity alone is conclusive, otherwise
+        candidates holds the issues that should go into the prompt (the top-k when there are more than k).
+        """
+        index = index or self.issue_index(issues)
+        text = " ".join(message.content for message in conversation.messages if message.role == Role.USER)
+        ranked = index.search(text, k=ISSUE_PREFILTER_TOP_K)
+
+        if not ranked or ranked[0][1] < ISSUE_NO_MATCH_THRESHOLD:
+            # No lexical overlap says nothing about the meaning, and the ranking would be arbitrary
+            return ((False, None), []) if ISSUE_PREFILTER_DECIDES else (None, issues)
+        if ISSUE_PREFILTER_DECIDES and ranked[0][1] >= ISSUE_MATCH_THRESHOLD:
+            return (True, ranked[0][0]), []
+
+        if len(issues) <= ISSUE_PREFILTER_TOP_K:
+            return None, issues
+        issues_by_id = {issue.issue_id: issue for issue in issues}
+        return None, [issues_by_id[issue_id] for issue_id, _ in ranked]
+
+    @staticmethod
+    def _transcript_budget(openai_client, template: CompiledTemplate, **fields: str) -> int:
+        # What is left of the client's prompt budget once the rest of the prompt is in place
+        overhead = openai_client.context_window.counter.count_text(template.render(**fields))
+        return openai_client.context_window.budget - overhead - TOKENS_PER_MESSAGE - TOKENS_PER_REPLY
+
+    def find_issue_prompt(self, issues: List[Issue], conversation: ConversationModel) -> str:
+        """
+        Renders the find-issue prompt for one conversation. Only the latest turns that fit in the classifier's
+        context budget next to the instructions and the issue list go into it.
+        """
+        issue_block = self.prompts.issue_block(issues)
+        budget = self._transcript_budget(self.classifier_client, FIND_ISSUE_TEMPLATE, conversation="", issues=issue_block)
+        return FIND_ISSUE_TEMPLATE.render(
+            conversation=self.prompts.fitted_transcript(conversation, self.classifier_client.context_window.counter, budget),
+            issues=issue_block
+        )
+
+    async def _coalesced(self, prompt: str, factory: Callable[[], Awaitable[str]]) -> str:
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one caller going away does not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+    @instrumented("chat")
+    async def find_issue(self, issues: List[Issue] = None, conversation: ConversationModel = None) -> Tuple[bool, Optional[str]]:
         """
         This function aims to identify if a user's reported issue matches any known issues from a predefined list. 
         It takes two arguments:
@@ -85,10 +203,118 @@ class ChatClient:
         - A tuple (bool, Optional[str]) where the boolean indicates if a matching issue was found, 
           and the Optional[str] is the 'issue_id' of the found issue or None if no match was found.
         """
-        pass # Replace this pass statement with your implementation.
+        issues = issues or self.issues
+        conversation = conversation or self.conversation
+
+        with PROMPT_BUILD_SECONDS.time("find_issue"):
+            answer, issues = self.prefilter_issues(issues, conversation)
+            if answer is not None:
+                return answer
+
+            prompt = self.find_issue_prompt(issues, conversation)
+        response = await self._coalesced(prompt, lambda: self.classifier_client.single_response(prompt=prompt))
+
+        issue_id = self.parse_issue_id(response or "", issues)
+        return issue_id is not None, issue_id
+
+    @instrumented("chat")
+    async def find_issues_batch(self, conversations: List[ConversationModel], issues: List[Issue] = None, batch_size: int = FIND_ISSUE_BATCH_SIZE, max_concurrency: int = FIND_ISSUE_BATCH_CONCURRENCY) -> List[Tuple[bool, Optional[str]]]:
+        """
+        Classifies many conversations against the same issue list. With ISSUE_PREFILTER_DECIDES on, conversations
+        the local issue index can answer on its own are resolved without the model. Identical conversations are
+        classified once, the rest are grouped into prompts of up to batch_size numbered conversations that list
+        the issues only once, and at most max_concurrency of those prompts are in flight at a time. Long
+        conversations are cut to their latest turns so every prompt fits in the model's context budget.
+
+        Returns one (found, issue_id) tuple per conversation, in input order.
+        """
+        issues = issues or self.issues
+
+        with PROMPT_BUILD_SECONDS.time("find_issues_batch"):
+            # Conversations the issue index can answer on its own never reach the model
+            results: List[Optional[Tuple[bool, Optional[str]]]] = [None] * len(conversations)
+            if ISSUE_PREFILTER_DECIDES:
+                index = self.issue_index(issues)
+                for position, conversation in enumerate(conversations):
+                    results[position], _ = self.prefilter_issues(issues, conversation, index)
+
+            # Deduplicate by the formatted transcript, which is exactly what the model sees. Each transcript is cut
+            # to what fits in a prompt of its own, since that is how the model's leftovers are classified
+            issue_block = self.prompts.issue_block(issues)
+            counter = self.classifier_client.context_window.counter
+            transcript_budget = self._transcript_budget(self.classifier_client, FIND_ISSUE_TEMPLATE, conversation="", issues=issue_block)
+            unique_transcripts: Dict[str, int] = {}
+            positions = {}
+            for index, conversation in enumerate(conversations):
+                if results[index] is None:
+                    transcript = self.prompts.fitted_transcript(conversation, counter, transcript_budget)
+                    positions[index] = unique_transcripts.setdefault(transcript, len(unique_transcripts))
+            transcripts = list(unique_transcripts)
+
+            # Group up to batch_size transcripts per prompt, starting a new group early when the next one would
+            # not fit in the batched prompt's budget
+            batch_client = get_openai_client(
+                model=self.model,
+                temperature=0,
+                max_tokens=FIND_ISSUE_TOKENS_PER_CONVERSATION * batch_size
+            )
+            group_budget = self._transcript_budget(batch_client, FIND_ISSUE_BATCH_TEMPLATE, issues=issue_block, conversations="")
+            groups: List[Tuple[int, int]] = []
+            group_tokens = 0
+            for index, transcript in enumerate(transcripts):
+                tokens = counter.count_text(transcript) + FIND_ISSUE_BATCH_TOKENS_PER_HEADER
+                if not groups or index - groups[-1][0] >= batch_size or group_tokens + tokens > group_budget:
+                    groups.append((index, index))
+                    group_tokens = 0
+                groups[-1] = (groups[-1][0], index + 1)
+                group_tokens += tokens
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        answers: List[Optional[str]] = [None] * len(transcripts)
+
+        async def classify(start: int, end: int) -> None:
+            group = transcripts[start:end]
+            async with semaphore:
+                if len(group) == 1:
+                    prompt = FIND_ISSUE_TEMPLATE.render(conversation=group[0], issues=issue_block)
+                    answers[start] = self.parse_issue_id(
+                        await self._coalesced(prompt, lambda: self.classifier_client.single_response(prompt=prompt)) or "", issues
+                    )
+                    return
+
+                prompt = FIND_ISSUE_BATCH_TEMPLATE.render(
+                    issues=issue_block,
+                    conversations="\n\n".join(
+                        f"CONVERSATION {number}:\n{transcript}" for number, transcript in enumerate(group, start=1)
+                    )
+                )
+                response = await self._coalesced(prompt, lambda: batch_client.single_response(prompt=prompt)) or ""
+
+            answered = set()
+            for number, answer in BATCH_ANSWER_PATTERN.findall(response):
+                index = int(number) - 1
+                if 0 <= index < len(group):
+                    answers[start + index] = self.parse_issue_id(answer, issues)
+                    answered.add(index)
+
+            # Anything the model skipped in the batched answer is classified on its own
+            for index in range(len(group)):
+                if index not in answered:
+                    prompt = FIND_ISSUE_TEMPLATE.render(conversation=group[index], issues=issue_block)
+                    async with semaphore:
+                        response = await self._coalesced(prompt, lambda: self.classifier_client.single_response(prompt=prompt))
+                    answers[start + index] = self.parse_issue_id(response or "", issues)
+
+        if groups:
+            await asyncio.gather(*[classify(start, end) for start, end in groups])
+
+        for index, position in positions.items():
+            results[index] = (answers[position] is not None, answers[position])
+        return results
 
     
-    def conversation_response(self, conversation: ConversationModel = None) -> str:
+    @instrumented("chat")
+    async def conversation_response(self, conversation: ConversationModel = None) -> str:
         """
         This function processes a conversation with a user, identifies if the user's issue matches any known issues, 
         and generates an appropriate response based on the conversation context.
@@ -118,6 +344,25 @@ class ChatClient:
         Returns:
         - A string containing the generated response to the user's messages, incorporating recognition of the user's issue if applicable.
         """
-        pass # Replace this pass statement with your implementation.
+        # The client is shared between requests, so work on the given conversation rather than storing it on the instance
+        conversation = conversation or self.conversation
+
+        found_issue, issue_id = await self.find_issue(conversation=conversation)
+
+        if found_issue:
+            issue = next((issue for issue in self.issues if issue.issue_id == issue_id), None)
+            if issue is not None:
+                conversation.messages.append(Message(
+                    role=Role.SYSTEM,
+                    content=f"The user's issue has been identified as: {issue.issue_name}. {issue.issue_description}"
+                ))
+
+        # OpenAIClient trims (or summarises) older turns to fit the model's context budget before sending
+        response = await self.openai_client.conversation_response(
+            messages=[message.model_dump(mode="json") for message in conversation.messages]
+        )
+
+        conversation.messages.append(Message(role=Role.SYSTEM, content=response))
+        return response
 
     
\ No newline at end of file
@@ -0,0 +1,38 @@
+# client_registry.py
+
+import threading
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class ClientRegistry:
+    """
+    Holds one shared client instance per configuration key for the lifetime of the process.
+    The dependency providers hand out these instances instead of building a new client per request;
+    app/main.py warms the registry at startup and clears it on shutdown.
+    """
+
+    def __init__(self):
+        self._clients: Dict[Hashable, Any] = {}
+        # Reentrant: a client factory may itself fetch the clients it depends on from the registry
+        self._lock = threading.RLock()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], T]) -> T:
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory()
+        return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+client_registry = ClientRegistry()
@@ -0,0 +1,179 @@
+# completion_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from app.services.metrics import metrics
+from app.services.request_context import current_route
+from app.services.ttl_cache import TTLCache
+
+OPENAI_CACHE_ENABLED = os.getenv("OPENAI_CACHE_ENABLED", "1") == "1"
+OPENAI_CACHE_SIZE = int(os.getenv("OPENAI_CACHE_SIZE", "10000"))
+OPENAI_CACHE_TTL = float(os.getenv("OPENAI_CACHE_TTL", "86400"))
+OPENAI_CACHE_SQLITE_PATH = os.getenv("OPENAI_CACHE_SQLITE_PATH")
+OPENAI_CACHE_NEAR_DUPLICATES = os.getenv("OPENAI_CACHE_NEAR_DUPLICATES", "0") == "1"
+OPENAI_CACHE_ALLOW_NONDETERMINISTIC = os.getenv("OPENAI_CACHE_ALLOW_NONDETERMINISTIC", "0") == "1"
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+TRAILING_PUNCTUATION_PATTERN = re.compile(r"[\s.!?,;:]+$")
+
+
+def normalize_content(content: str) -> str:
+    # Near-duplicate form: case, runs of whitespace and trailing punctuation do not change the key
+    return TRAILING_PUNCTUATION_PATTERN.sub("", WHITESPACE_PATTERN.sub(" ", content.casefold()).strip())
+
+
+class SQLiteCompletionStore:
+    """
+    On-disk tier of the completion cache. Calls are made from worker threads, so access to the shared
+    connection is serialised with a lock.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM completions WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CompletionCache:
+    """
+    Cache for buffered chat completions, keyed on the canonicalised (model, messages, temperature, max_tokens).
+
+    Lookups go to an in-memory LRU+TTL tier first and then to the optional SQLite tier. With near_duplicates
+    enabled, a second key built from normalised message contents also matches prompts that only differ in case,
+    whitespace or trailing punctuation. Completions with temperature > 0 are never cached unless
+    allow_nondeterministic is set. Hits and misses are counted per route in 'stats'.
+    """
+
+    def __init__(self, maxsize: int = OPENAI_CACHE_SIZE, ttl: float = OPENAI_CACHE_TTL, sqlite_path: str = None, near_duplicates: bool = False, allow_nondeterministic: bool = False):
+        self.ttl = ttl
+        self.memory: TTLCache[str] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = SQLiteCompletionStore(sqlite_path) if sqlite_path else None
+        self.near_duplicates = near_duplicates
+        self.allow_nondeterministic = allow_nondeterministic
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "near_hits": 0, "misses": 0, "skipped": 0})
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, max_tokens: int, near_duplicate: bool = False) -> str:
+        canonical_messages = [
+            [getattr(message["role"], "value", message["role"]), normalize_content(message["content"]) if near_duplicate else message["content"]]
+            for message in messages
+        ]
+        canonical = json.dumps(
+            [getattr(model, "value", model), canonical_messages, float(temperature), int(max_tokens)],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        prefix = "near:" if near_duplicate else "exact:"
+        return prefix + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature: float) -> bool:
+        return temperature == 0 or self.allow_nondeterministic
+
+    async def _lookup(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = await asyncio.to_thread(self.store.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def get(self, model: str, messages: list, temperature: float, max_tokens: int) -> Optional[str]:
+        stats = self.stats[current_route.get()]
+        if not self.cacheable(temperature):
+            stats["skipped"] += 1
+            return None
+
+        value = await self._lookup(self.make_key(model, messages, temperature, max_tokens))
+        if value is not None:
+            stats["hits"] += 1
+            return value
+
+        if self.near_duplicates:
+            value = await self._lookup(self.make_key(model, messages, temperature, max_tokens, near_duplicate=True))
+            if value is not None:
+                stats["near_hits"] += 1
+                return value
+
+        stats["misses"] += 1
+        return None
+
+    async def set(self, model: str, messages: list, temperature: float, max_tokens: int, value: str) -> None:
+        if not self.cacheable(temperature) or value is None:
+            return
+
+        keys = [self.make_key(model, messages, temperature, max_tokens)]
+        if self.near_duplicates:
+            keys.append(self.make_key(model, messages, temperature, max_tokens, near_duplicate=True))
+
+        for key in keys:
+            self.memory.set(key, value)
+            if self.store is not None:
+                await asyncio.to_thread(self.store.set, key, value, self.ttl)
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+_completion_cache: Optional[CompletionCache] = None
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    global _completion_cache
+    if _completion_cache is None and OPENAI_CACHE_ENABLED:
+        _completion_cache = CompletionCache(
+            sqlite_path=OPENAI_CACHE_SQLITE_PATH,
+            near_duplicates=OPENAI_CACHE_NEAR_DUPLICATES,
+            allow_nondeterministic=OPENAI_CACHE_ALLOW_NONDETERMINISTIC,
+        )
+    return _completion_cache
+
+def _cache_samples():
+    # Exposes the per-route hit/miss counters on /metrics
+    if _completion_cache is None:
+        return []
+    samples = [
+        ({"route": route, "result": result}, count)
+        for route, counts in list(_completion_cache.stats.items())
+        for result, count in counts.items()
+    ]
+    return [("completion_cache_lookups_total", "counter", "Completion cache lookups by route and result", samples)]
+
+metrics.register_collector(_cache_samples)
+
+def close_completion_cache() -> None:
+    global _completion_cache
+    if _completion_cache is not None:
+        _completion_cache.close()
+        _completion_cache = None
@@ -0,0 +1,139 @@
+# context_window.py
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Awaitable, Callable, List, Optional
+
+from app.services.ttl_cache import TTLCache
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - falls back to a character-based estimate
+    tiktoken = None
+
+# Total context sizes per model; the reply's max_tokens is reserved out of this
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 4096
+
+# Overrides the per-model budget for the prompt part of the request when set
+OPENAI_CONTEXT_TOKEN_BUDGET = os.getenv("OPENAI_CONTEXT_TOKEN_BUDGET")
+OPENAI_CONTEXT_SUMMARIZE = os.getenv("OPENAI_CONTEXT_SUMMARIZE", "0") == "1"
+
+# Chat formatting overhead, as counted by the provider
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+SUMMARY_PROMPT = """
+Summarise the following earlier part of a support conversation in a few sentences. \
+Keep every fact, request and commitment that may matter for the rest of the conversation.
+
+{conversation}
+"""
+
+Summarizer = Callable[[List[dict]], Awaitable[str]]
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class TokenCounter:
+    """
+    Counts tokens locally with the model's tokenizer. Counts are memoised per message content, so on every
+    turn of a conversation only the messages that were not seen before are tokenized. The memo is keyed by a
+    digest of the content, so it does not keep a copy of every prompt.
+    """
+
+    def __init__(self, model: str, cache_size: int = 100000):
+        self.encoding = get_encoding(model)
+        self._counts: TTLCache[int] = TTLCache(maxsize=cache_size, ttl=float("inf"))
+
+    def count_text(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        count = self._counts.get(key)
+        if count is None:
+            count = len(self.encoding.encode(text)) if self.encoding is not None else len(text) // 4 + 1
+            self._counts.set(key, count)
+        return count
+
+    def count_message(self, message: dict) -> int:
+        return TOKENS_PER_MESSAGE + self.count_text(message["content"])
+
+    def count_messages(self, messages: List[dict]) -> int:
+        return sum(self.count_message(message) for message in messages) + TOKENS_PER_REPLY
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str) -> TokenCounter:
+    # One memo per model, shared by every client configuration that uses it
+    return TokenCounter(model)
+
+
+class ContextWindow:
+    """
+    Fits a conversation into the model's prompt budget before it is sent upstream.
+
+    Leading system messages and the latest message are always kept. Older turns are dropped oldest first
+    until the rest fits; with a summarizer the dropped turns are replaced by a single system message holding
+    their summary (summaries are cached per dropped prefix, so a stable prefix is only summarised once).
+    """
+
+    def __init__(self, model: str, budget: int, summarizer: Optional[Summarizer] = None):
+        self.counter = get_token_counter(model)
+        self.budget = budget
+        self.summarizer = summarizer
+        self._summaries: TTLCache[str] = TTLCache(maxsize=1000, ttl=3600)
+
+    async def fit(self, messages: List[dict]) -> List[dict]:
+        counts = [self.counter.count_message(message) for message in messages]
+        total = sum(counts) + TOKENS_PER_REPLY
+        if total <= self.budget or len(messages) < 2:
+            return messages
+
+        head = 0
+        while head < len(messages) - 1 and messages[head]["role"] == "system":
+            head += 1
+
+        # Drop the oldest turns after the leading system messages, never the latest message
+        cut = head
+        while total > self.budget and cut < len(messages) - 1:
+            total -= counts[cut]
+            cut += 1
+        dropped = messages[head:cut]
+        kept = messages[:head] + messages[cut:]
+
+        if self.summarizer is None or not dropped:
+            return kept
+
+        summary_message = {"role": "system", "content": "Summary of the earlier conversation: " + await self._summarize(dropped)}
+        # Make room for the summary itself if needed
+        total += self.counter.count_message(summary_message)
+        while total > self.budget and cut < len(messages) - 1:
+            total -= counts[cut]
+            cut += 1
+        return messages[:head] + [summary_message] + messages[cut:]
+
+    async def _summarize(self, dropped: List[dict]) -> str:
+        key = hashlib.sha256(json.dumps([[m["role"], m["content"]] for m in dropped]).encode("utf-8")).hexdigest()
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = await self.summarizer(dropped)
+            self._summaries.set(key, summary)
+        return summary
+
+
+def context_budget(model: str, max_tokens: int) -> int:
+    if OPENAI_CONTEXT_TOKEN_BUDGET:
+        return int(OPENAI_CONTEXT_TOKEN_BUDGET)
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS) - max_tokens
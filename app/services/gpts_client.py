@@ -2,41 +2,78 @@
 
 import asyncio
 import json
+import logging
 import os
-import time
-from typing import Any, Dict, List, Optional
+import random
+import weakref
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 import openai
 from enum import Enum
 
 from pydantic import BaseModel, Field
 
 from app.models.schemas import Assistant, DeletionResponse, FileObject
+from app.services.client_registry import client_registry
+from app.services.metrics import GPTS_RUN_POLLS, instrumented
+from app.services.openai_client import get_async_openai
+from app.services.rate_limiter import call_with_retries
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Run driver settings: polling backoff (used when run streaming is unavailable) and the overall deadline
+RUN_POLL_INITIAL_DELAY = float(os.getenv("GPTS_RUN_POLL_INITIAL_DELAY", "0.2"))
+RUN_POLL_MAX_DELAY = float(os.getenv("GPTS_RUN_POLL_MAX_DELAY", "5"))
+RUN_DEADLINE = float(os.getenv("GPTS_RUN_DEADLINE", "120"))
+
+# Tool calls from one required_action batch run concurrently, up to this many at a time
+TOOL_CONCURRENCY = int(os.getenv("GPTS_TOOL_CONCURRENCY", "8"))
+TOOL_TIMEOUT = float(os.getenv("GPTS_TOOL_TIMEOUT", "30"))
+
+# Conversation -> thread mapping, so follow-up turns reuse the thread instead of replaying the history
+THREAD_CACHE_SIZE = int(os.getenv("GPTS_THREAD_CACHE_SIZE", "10000"))
+THREAD_CACHE_TTL = float(os.getenv("GPTS_THREAD_CACHE_TTL", "3600"))
+
+RUN_FAILED_STATUSES = ["failed", "cancelled", "expired"]
+
 def get_gpts_client():
-    return GPTSClient(api_key=OPENAI_API_KEY)
+    return client_registry.get_or_create(("gpts",), lambda: GPTSClient(api_key=OPENAI_API_KEY))
 
 class OpenAIModel(str, Enum):
     GPT_3 = "gpt-3.5-turbo"
     GPT_3_5 = "gpt-3.5-turbo"
     GPT_4 = "gpt-4"
 
+class CachedThread(NamedTuple):
+    thread_id: str
+    assistant_id: str
+    message_count: int
+    last_message_id: Optional[str]
+
 class GPTSClient:
     
-    def __init__(self, api_key: str, model: OpenAIModel = OpenAIModel.GPT_3_5, temperature: float = 0.7, max_tokens: int = 250):
+    def __init__(self, api_key: str, model: OpenAIModel = OpenAIModel.GPT_3_5, temperature: float = 0.7, max_tokens: int = 250, client: openai.AsyncOpenAI = None, run_deadline: float = RUN_DEADLINE, tool_concurrency: int = TOOL_CONCURRENCY, tool_timeout: float = TOOL_TIMEOUT):
         self.api_key = api_key
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
-        openai.api_key = self.api_key
+        self.client = client or get_async_openai()
+        self.run_deadline = run_deadline
+        self.tool_concurrency = tool_concurrency
+        self.tool_timeout = tool_timeout
+        self.thread_cache: TTLCache[CachedThread] = TTLCache(maxsize=THREAD_CACHE_SIZE, ttl=THREAD_CACHE_TTL)
+        self._conversation_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # None until the first run tells us whether the SDK supports run streaming
+        self.run_streaming: Optional[bool] = None
         
-    def create_assistant(self, name: str, model: OpenAIModel = OpenAIModel.GPT_3_5, instructions: str = None, tools: list = None, file_ids: list = None, metadata: dict = None) -> Assistant:
+    async def create_assistant(self, name: str, model: OpenAIModel = OpenAIModel.GPT_3_5, instructions: str = None, tools: list = None, file_ids: list = None, metadata: dict = None) -> Assistant:
         
         if name is None:
             raise ValueError("Name is required")
         
-        new_assistant = openai.beta.assistants.create(
+        new_assistant = await self.client.beta.assistants.create(
             instructions=instructions,
             name=name,
             tools=tools or [],
@@ -45,18 +82,18 @@ class GPTSClient:
             metadata=metadata or {}
         )
         
-        return GPTSClient.Assistant(**new_assistant)
+        return Assistant.model_validate(new_assistant)
     
-    def get_assistant(self, assistant_id: str) -> Assistant:
-        assistant = openai.beta.assistants.retrieve(assistant_id)
+    async def get_assistant(self, assistant_id: str) -> Assistant:
+        assistant = await self.client.beta.assistants.retrieve(assistant_id)
         if assistant is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
-        return GPTSClient.Assistant(**assistant)
+        return Assistant.model_validate(assistant)
     
-    def update_assistant(self,  assistant_id: str, overwrite: bool = False, name: str = None, instructions: str = None, tools: list = None, file_ids: list = None, metadata: dict = None) -> Assistant:
+    async def update_assistant(self,  assistant_id: str, overwrite: bool = False, name: str = None, instructions: str = None, tools: list = None, file_ids: list = None, metadata: dict = None) -> Assistant:
         
         if not overwrite:
-            existing_assistant = self.get_assistant(assistant_id)
+            existing_assistant = await self.get_assistant(assistant_id)
             
             if existing_assistant is None:
                 raise ValueError(f"Assistant with id {assistant_id} does not exist")
@@ -65,7 +102,7 @@ class GPTSClient:
             file_ids = list(set(existing_assistant.file_ids + (file_ids or [])))
             metadata = {**existing_assistant.metadata, **(metadata or {})}
         
-        updated_assistant = openai.beta.assistants.update(
+        updated_assistant = await self.client.beta.assistants.update(
             assistant_id,
             instructions=instructions,
             name=name,
@@ -77,172 +114,315 @@ class GPTSClient:
         if updated_assistant is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
         
-        return GPTSClient.Assistant(**updated_assistant)
+        return Assistant.model_validate(updated_assistant)
     
-    def delete_assistant(self, assistant_id: str) -> DeletionResponse:
+    async def delete_assistant(self, assistant_id: str) -> DeletionResponse:
         
-        deleted_object = openai.beta.assistants.delete(assistant_id)
+        deleted_object = await self.client.beta.assistants.delete(assistant_id)
         
         if deleted_object is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
         
-        return GPTSClient.DeletionResponse(**deleted_object)
+        return DeletionResponse.model_validate(deleted_object)
         
-    def list_assistants(self, order: str) -> List[Assistant]:
+    async def list_assistants(self, order: str) -> List[Assistant]:
         
         if order not in ["asc", "desc"]:
             raise ValueError("Order must be 'asc' or 'desc'")
         
-        assistants = openai.beta.assistants.list(order=order)
+        assistants = self.client.beta.assistants.list(order=order)
         
-        return [GPTSClient.Assistant(**assistant) for assistant in assistants]
+        return [Assistant.model_validate(assistant) async for assistant in assistants]
     
-    def attach_file(self, assistant_id: str, file_id: str) -> FileObject:
+    async def attach_file(self, assistant_id: str, file_id: str) -> FileObject:
         
-        assistant = self.get_assistant(assistant_id)
+        assistant = await self.get_assistant(assistant_id)
         
         if assistant is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
         
-        created_file = openai.beta.assistants.files.create(assistant_id, file_id)
+        created_file = await self.client.beta.assistants.files.create(assistant_id, file_id)
         
         if created_file is None:
             raise ValueError(f"File with id {file_id} does not exist")
         
-        return GPTSClient.FileObject(**created_file)
+        return FileObject.model_validate(created_file)
     
-    def retrieve_file(self, assistant_id: str, file_id: str) -> FileObject:
+    async def retrieve_file(self, assistant_id: str, file_id: str) -> FileObject:
         
-        assistant = self.get_assistant(assistant_id)
+        assistant = await self.get_assistant(assistant_id)
         
         if assistant is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
         
-        file = openai.beta.assistants.files.retrieve(assistant_id, file_id)
+        file = await self.client.beta.assistants.files.retrieve(assistant_id, file_id)
         
         if file is None:
             raise ValueError(f"File with id {file_id} does not exist")
         
-        return GPTSClient.FileObject(**file)
+        return FileObject.model_validate(file)
     
-    def delete_file(self, assistant_id: str, file_id: str) -> DeletionResponse:
+    async def delete_file(self, assistant_id: str, file_id: str) -> DeletionResponse:
         
-        assistant = self.get_assistant(assistant_id)
+        assistant = await self.get_assistant(assistant_id)
         
         if assistant is None:
             raise ValueError(f"Assistant with id {assistant_id} does not exist")
         
-        deleted_file = openai.beta.assistants.files.delete(assistant_id, file_id)
+        deleted_file = await self.client.beta.assistants.files.delete(assistant_id, file_id)
         
         if deleted_file is None:
             raise ValueError(f"File with id {file_id} does not exist")
         
-        return GPTSClient.DeletionResponse(**deleted_file)
+        return DeletionResponse.model_validate(deleted_file)
     
-    async def run_thread(thread_id: str, assistant_id: str, callback: Any) -> str:
-        # Create a run with specific instructions
-        run = openai.beta.threads.runs.create(
+    async def _run_tool_call(self, tool_call, callback: Any, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        functionName = tool_call.function.name
+
+        try:
+            args = json.loads(tool_call.function.arguments)
+
+            # Dynamically call the function with arguments
+            async with semaphore:
+                output = await asyncio.wait_for(callback(functionName, args), timeout=self.tool_timeout)
+        except asyncio.TimeoutError:
+            output = {"error": f"Tool {functionName} timed out after {self.tool_timeout} seconds"}
+        except Exception as e:
+            # Report the failure to the assistant instead of aborting the whole run
+            output = {"error": f"Tool {functionName} failed: {e}"}
+
+        return {
+            "tool_call_id": tool_call.id,
+            "output": output if isinstance(output, str) else json.dumps(output),
+        }
+
+    async def _run_tool_calls(self, run, callback: Any) -> List[Dict[str, Any]]:
+        # Independent tool calls in one batch run concurrently, so the step takes as long as the slowest call
+        semaphore = asyncio.Semaphore(self.tool_concurrency)
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+
+        return list(await asyncio.gather(*[
+            self._run_tool_call(tool_call, callback, semaphore) for tool_call in tool_calls
+        ]))
+
+    async def _drive_run_streaming(self, thread_id: str, assistant_id: str, callback: Any, state: Dict[str, Any]):
+        # Consume run events as they happen instead of asking for the status
+        try:
+            stream = await call_with_retries(lambda: self.client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                stream=True,
+            ))
+        except TypeError:
+            # Older SDKs do not accept stream=True on runs
+            return None
+
+        while stream is not None:
+            next_stream = None
+            try:
+                async for event in stream:
+                    run = event.data
+                    if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                        state["run_id"] = run.id
+
+                    if event.event == "thread.run.completed":
+                        return run
+
+                    if event.event in ["thread.run.failed", "thread.run.cancelled", "thread.run.expired"]:
+                        raise ValueError("Run failed with status: " + run.status)
+
+                    if event.event == "thread.run.requires_action":
+                        tool_outputs = await self._run_tool_calls(run, callback)
+                        next_stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                            thread_id=thread_id,
+                            run_id=run.id,
+                            tool_outputs=tool_outputs,
+                            stream=True,
+                        )
+                        break
+            finally:
+                await stream.close()
+            stream = next_stream
+
+        raise ValueError("Run event stream ended before the run completed")
+
+    async def _drive_run_polling(self, thread_id: str, assistant_id: str, callback: Any, state: Dict[str, Any]):
+        state.update(driver="polling", polls=0)
+        run = await call_with_retries(lambda: self.client.beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=assistant_id,
-        )
+        ))
+        state["run_id"] = run.id
 
-        # Check for run completion and stream responses using a callback
+        # Poll with exponential backoff and jitter; the delay resets whenever the run makes progress
+        delay = RUN_POLL_INITIAL_DELAY
         while run.status != "completed":
-            
-            time.sleep(0.1)
-            run = openai.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            
-            if run.status in ["failed", "cancelled", "expired"]:
+
+            if run.status in RUN_FAILED_STATUSES:
                 raise ValueError("Run failed with status: " + run.status)
 
             if run.status == "requires_action":
-                tool_outputs = []
-
-                for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                    functionName = tool_call.function.name
-                    args = json.loads(tool_call.function.arguments)
-                    
-                    # Dynamically call the function with arguments
-                    output = await callback(functionName, args)
-                                            
-                    tool_outputs.append({
-                        "tool_call_id": tool_call.id,
-                        "output": output,
-                    })
-
-                # Submit tool outputs
-                openai.beta.threads.runs.submit_tool_outputs(
+                tool_outputs = await self._run_tool_calls(run, callback)
+                run = await self.client.beta.threads.runs.submit_tool_outputs(
                     thread_id=thread_id,
                     run_id=run.id,
                     tool_outputs=tool_outputs
                 )
-        
-                            
-        # Assuming `messages` is a response object from the OpenAI API that contains message data in a list
-        messages = openai.beta.threads.messages.list(
-            thread_id=thread_id
-        )
+                delay = RUN_POLL_INITIAL_DELAY
+                continue
+
+            await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+            delay = min(delay * 2, RUN_POLL_MAX_DELAY)
+            run_id = run.id
+            run = await call_with_retries(lambda: self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id))
+            state["polls"] += 1
+
+        return run
+
+    async def _drive_run(self, thread_id: str, assistant_id: str, callback: Any, state: Dict[str, Any]):
+        if self.run_streaming is not False:
+            run = await self._drive_run_streaming(thread_id, assistant_id, callback, state)
+            if run is not None:
+                self.run_streaming = True
+                return run
+            # Remember that streaming is unavailable and poll from now on
+            self.run_streaming = False
+
+        return await self._drive_run_polling(thread_id, assistant_id, callback, state)
+
+    async def _complete_run(self, thread_id: str, assistant_id: str, callback: Any, after: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Runs the assistant on the thread and returns its reply together with the id of the last message on the
+        thread. When 'after' is given only messages created after that message id are fetched, page by page
+        through the list cursor, instead of re-listing the whole history.
+        """
+        state: Dict[str, Any] = {"driver": "streaming", "polls": 0}
+
+        try:
+            await asyncio.wait_for(self._drive_run(thread_id, assistant_id, callback, state), timeout=self.run_deadline)
+        except asyncio.TimeoutError:
+            if "run_id" in state:
+                try:
+                    await self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=state["run_id"])
+                except openai.OpenAIError:
+                    pass
+            raise ValueError(f"Run did not complete within {self.run_deadline} seconds")
+        finally:
+            GPTS_RUN_POLLS.observe(state["polls"], state["driver"])
 
-        # Sort messages by their creation time
-        sorted_messages = sorted(messages.data, key=lambda x: x.created_at)
+        new_messages = []
+        async for message in self.client.beta.threads.messages.list(thread_id=thread_id, order="asc", after=after):
+            new_messages.append(message)
 
-        # Iterate through the sorted messages (skipping the first one), 
-        # find those of type "text", and join their text values into a final string
+        # Without a cursor the first message is the prompt that started the thread, so skip it
+        if after is None:
+            new_messages = new_messages[1:]
+
+        # Find the messages of type "text" and join their text values into a final string
         final_message = "\n".join([
             ", ".join(blurb.text.value for blurb in message.content if blurb.type == "text")
-            for message in sorted_messages[1:]
+            for message in new_messages
         ])
 
+        last_message_id = new_messages[-1].id if new_messages else after
+        return final_message, last_message_id
+
+    @instrumented("gpts")
+    async def run_thread(self, thread_id: str, assistant_id: str, callback: Any, after: Optional[str] = None) -> str:
+        final_message, _ = await self._complete_run(thread_id, assistant_id, callback, after=after)
         return final_message
 
-    
+    @instrumented("gpts")
     async def single_response(self, assistant_id: str, prompt: str, callback) -> str:
         try:
             # Create a new thread
-            thread = openai.beta.threads.create()
+            thread = await call_with_retries(self.client.beta.threads.create)
 
             # Post the initial user message to the thread
-            initial_message = openai.beta.threads.messages.create(
+            initial_message = await self.client.beta.threads.messages.create(
                 thread_id=thread.id,
                 role="user",
                 content=prompt
             )
-            
-            return await GPTSClient.run_thread(thread.id, assistant_id, callback)
 
-            
+            return await self.run_thread(thread.id, assistant_id, callback, after=initial_message.id)
+
+
         except ValueError as e:
-            print(f"Error during streaming: {e}")
+            logger.warning("Error during streaming: %s", e)
 
-        
+
+    @instrumented("gpts")
     async def server_and_user_message_response(self, assistant_id: str, server_prompt: str, user_prompt: str, callback) -> str:
-        
-        thread = openai.beta.threads.create()
-        
-        openai.beta.threads.messages.create(
+
+        thread = await call_with_retries(self.client.beta.threads.create)
+
+        await self.client.beta.threads.messages.create(
             thread_id=thread.id,
             role="system",
             content=server_prompt
         )
-        
-        openai.beta.threads.messages.create(
+
+        user_message = await self.client.beta.threads.messages.create(
             thread_id=thread.id,
             role="user",
             content=user_prompt
         )
-        
-        return await GPTSClient.run_thread(thread.id, assistant_id, callback)
 
-        
-    async def conversation_response(self, assistant_id: str, messages: list, callback) -> str:
-        
-        thread = openai.beta.threads.create()
-        
-        for message in messages:
-            openai.beta.threads.messages.create(
-                thread_id=thread.id,
+        return await self.run_thread(thread.id, assistant_id, callback, after=user_message.id)
+
+
+    @instrumented("gpts")
+    async def conversation_response(self, assistant_id: str, messages: list, callback, conversation_id: str = None) -> str:
+        """
+        Runs the assistant over a conversation. With a conversation_id the thread is kept in the thread cache,
+        so the next turn only appends the messages the thread has not seen yet: earlier replies (assistant or
+        system messages after the first sync) are already on the thread as run output and are skipped.
+        A shorter history than the one synced means the conversation diverged, and a new thread is started.
+        """
+        if conversation_id is None:
+            return await self._conversation_turn(assistant_id, messages, callback, None)
+
+        lock = self._conversation_locks.get(conversation_id)
+        if lock is None:
+            lock = self._conversation_locks[conversation_id] = asyncio.Lock()
+
+        # Turns of the same conversation share a thread, so they must not run at the same time
+        async with lock:
+            return await self._conversation_turn(assistant_id, messages, callback, conversation_id)
+
+    async def _conversation_turn(self, assistant_id: str, messages: list, callback, conversation_id: Optional[str]) -> str:
+        cached = self.thread_cache.get(conversation_id) if conversation_id is not None else None
+
+        if cached is not None and cached.assistant_id == assistant_id and len(messages) >= cached.message_count:
+            thread_id = cached.thread_id
+            last_message_id = cached.last_message_id
+            new_messages = [
+                message for message in messages[cached.message_count:]
+                if message["role"] not in ["assistant", "system"]
+            ]
+        else:
+            thread = await call_with_retries(self.client.beta.threads.create)
+            thread_id = thread.id
+            last_message_id = None
+            new_messages = messages
+
+        for message in new_messages:
+            created_message = await self.client.beta.threads.messages.create(
+                thread_id=thread_id,
                 role=message["role"],
                 content=message["content"]
             )
-        
-        return await GPTSClient.run_thread(thread.id, assistant_id, callback)
+            last_message_id = created_message.id
+
+        final_message, last_message_id = await self._complete_run(thread_id, assistant_id, callback, after=last_message_id)
+
+        if conversation_id is not None:
+            self.thread_cache.set(conversation_id, CachedThread(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                message_count=len(messages),
+                last_message_id=last_message_id,
+            ))
+
+        return final_message
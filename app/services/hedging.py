@@ -0,0 +1,162 @@
+# hedging.py
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "0") == "1"
+# Fixed hedge delay in seconds; when unset the delay follows the observed OPENAI_HEDGE_PERCENTILE latency
+OPENAI_HEDGE_DELAY = os.getenv("OPENAI_HEDGE_DELAY")
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "95"))
+OPENAI_HEDGE_FALLBACK_MODEL = os.getenv("OPENAI_HEDGE_FALLBACK_MODEL")
+OPENAI_HEDGE_MAX_RATIO = float(os.getenv("OPENAI_HEDGE_MAX_RATIO", "0.1"))
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent latencies and answers percentile queries over them.
+    """
+
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+async def _cancel_all(tasks: Set[asyncio.Future]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class HedgingPolicy:
+    """
+    Sends a duplicate ("hedged") request when the first one is slower than a fixed delay or than the observed
+    pN latency, optionally to a fallback model, and keeps whichever answer arrives first; the other request is
+    cancelled. Buffered calls race on the complete answer, streams race on the first token.
+
+    Hedges are paid for out of a budget: every primary request earns max_hedge_ratio of a hedge, so at most
+    that share of requests (plus a small burst) is ever duplicated.
+    """
+
+    def __init__(self, delay: float = None, percentile: float = 95, fallback_model: str = None, max_hedge_ratio: float = 0.1, max_burst: float = 10):
+        self.delay = delay
+        self.percentile = percentile
+        self.fallback_model = fallback_model
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_burst = max_burst
+        self.latency = LatencyTracker()
+        self.first_token_latency = LatencyTracker()
+        self._budget = 0.0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgingPolicy"]:
+        if not OPENAI_HEDGE_ENABLED:
+            return None
+        return cls(
+            delay=float(OPENAI_HEDGE_DELAY) if OPENAI_HEDGE_DELAY else None,
+            percentile=OPENAI_HEDGE_PERCENTILE,
+            fallback_model=OPENAI_HEDGE_FALLBACK_MODEL,
+            max_hedge_ratio=OPENAI_HEDGE_MAX_RATIO,
+        )
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        self._budget = min(self.max_burst, self._budget + self.max_hedge_ratio)
+        if self.delay is not None:
+            return self.delay
+        return tracker.percentile(self.percentile)
+
+    def _spend_budget(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        self.hedges_sent += 1
+        return True
+
+    async def race(self, call: Callable[[str], Awaitable[T]], model: str) -> T:
+        started_at = time.perf_counter()
+        delay = self._hedge_delay(self.latency)
+        primary = asyncio.ensure_future(call(model))
+        pending = {primary}
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and self._spend_budget():
+                    pending.add(asyncio.ensure_future(call(self.fallback_model or model)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.record(time.perf_counter() - started_at)
+                        if task is not primary:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            await _cancel_all(pending)
+
+    async def race_stream(self, open_stream: Callable[[str], AsyncIterator[str]], model: str) -> AsyncIterator[str]:
+        started_at = time.perf_counter()
+        delay = self._hedge_delay(self.first_token_latency)
+        primary = open_stream(model)
+        streams = {}
+        streams[asyncio.ensure_future(primary.__anext__())] = primary
+        winner = None
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(set(streams), timeout=delay)
+                if not done and self._spend_budget():
+                    hedge = open_stream(self.fallback_model or model)
+                    streams[asyncio.ensure_future(hedge.__anext__())] = hedge
+
+            # The first stream to produce a token (or to finish cleanly) wins
+            error = None
+            pending = set(streams)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None or isinstance(task.exception(), StopAsyncIteration):
+                        winner = task
+                        break
+                    error = task.exception()
+            if winner is None:
+                raise error
+        finally:
+            losers = {task for task in streams if task is not winner}
+            await _cancel_all(losers)
+            for task in losers:
+                await streams[task].aclose()
+
+        stream = streams[winner]
+        if stream is not primary:
+            self.hedges_won += 1
+        if isinstance(winner.exception(), StopAsyncIteration):
+            return
+
+        self.first_token_latency.record(time.perf_counter() - started_at)
+        try:
+            yield winner.result()
+            async for token in stream:
+                yield token
+        finally:
+            await stream.aclose()
@@ -0,0 +1,47 @@
+# issue_catalog.py
+
+import hashlib
+import os
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+
+from app.models.schemas import Issue
+from app.services.ttl_cache import TTLCache
+
+ISSUE_CATALOG_SIZE = int(os.getenv("ISSUE_CATALOG_SIZE", "1024"))
+ISSUE_CATALOG_TTL = float(os.getenv("ISSUE_CATALOG_TTL", "86400"))
+
+# Built once: the validator and serializer for a list of issues are compiled when the adapter is created
+ISSUE_LIST_ADAPTER = TypeAdapter(List[Issue])
+
+
+def catalog_id(issues: List[Issue]) -> str:
+    # Content hash of the canonical JSON, so the same issue list gets the same id in every process and after restarts
+    return hashlib.sha256(ISSUE_LIST_ADAPTER.dump_json(issues)).hexdigest()[:32]
+
+
+class IssueCatalog:
+    """
+    Issue lists registered once and then referenced by id. A catalogue is validated when it is registered;
+    requests that only carry its id skip validating and copying the issues, and every request for the
+    catalogue shares the same Issue objects, so the prompt builder and issue index caches stay warm.
+    """
+
+    def __init__(self, maxsize: int = ISSUE_CATALOG_SIZE, ttl: float = ISSUE_CATALOG_TTL):
+        self._catalogs: TTLCache[List[Issue]] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def register(self, issues: List[Issue]) -> str:
+        key = catalog_id(issues)
+        # Re-registering refreshes the TTL but keeps the objects already shared by earlier requests
+        self._catalogs.set(key, self._catalogs.get(key) or list(issues))
+        return key
+
+    def get(self, key: str) -> Optional[List[Issue]]:
+        return self._catalogs.get(key)
+
+    def __len__(self) -> int:
+        return len(self._catalogs)
+
+
+issue_catalog = IssueCatalog()
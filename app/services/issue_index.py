@@ -0,0 +1,98 @@
+# issue_index.py
+
+import re
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.schemas import Issue
+
+ISSUE_INDEX_DIMENSIONS = 4096
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "i", "in", "is", "it",
+    "its", "it's", "me", "my", "of", "on", "or", "our", "so", "that", "the", "their", "them", "they", "this", "to",
+    "was", "we", "were", "what", "when", "with", "you", "your",
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+def text_features(text: str) -> List[str]:
+    # Words plus their character trigrams, so "order" and "orders" still overlap
+    features = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        features.append(word)
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def hashing_embedder(texts: Sequence[str], dimensions: int = ISSUE_INDEX_DIMENSIONS) -> np.ndarray:
+    """
+    Embeds texts locally with feature hashing over words and character trigrams and returns
+    L2-normalised float32 rows. crc32 keeps the buckets stable across processes.
+    """
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        buckets = [zlib.crc32(feature.encode("utf-8")) % dimensions for feature in text_features(text)]
+        if buckets:
+            np.add.at(matrix[row], buckets, 1.0)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class IssueIndex:
+    """
+    Vector index over issue names and descriptions used to pick the candidate issues for a conversation
+    before anything is sent to the model. An index is built for one issue list and never changes; a changed
+    list gets a new index (see ChatClient.issue_index). Issues are embedded once, and search() is a single
+    matrix-vector product over the stored rows.
+    """
+
+    def __init__(self, issues: Iterable[Issue], embedder: Embedder = hashing_embedder):
+        self.embedder = embedder
+        # A repeated issue id keeps its last definition, as in the prompt's issue lookup
+        by_id = {issue.issue_id: issue for issue in issues}
+        self._ids: List[str] = list(by_id)
+        self._rows: Dict[str, int] = {issue_id: row for row, issue_id in enumerate(self._ids)}
+        self._matrix: Optional[np.ndarray] = (
+            self.embedder([self.issue_text(issue) for issue in by_id.values()]) if by_id else None
+        )
+
+    @staticmethod
+    def issue_text(issue: Issue) -> str:
+        return f"{issue.issue_name}. {issue.issue_description}"
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def search(self, text: str, k: int, issue_ids: Iterable[str] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (issue_id, cosine similarity) pairs, best first. issue_ids restricts the search
+        to a subset of the indexed issues.
+        """
+        if self._matrix is None or k <= 0:
+            return []
+
+        if issue_ids is None:
+            rows = np.arange(len(self._ids))
+        else:
+            rows = np.fromiter((self._rows[issue_id] for issue_id in issue_ids if issue_id in self._rows), dtype=np.intp)
+            if rows.size == 0:
+                return []
+
+        query = self.embedder([text])[0]
+        scores = (self._matrix @ query)[rows]
+
+        k = min(k, rows.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[rows[i]], float(scores[i])) for i in top]
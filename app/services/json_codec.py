@@ -0,0 +1,22 @@
+# json_codec.py
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the standard library encoder
+    orjson = None
+
+
+def dumps(data: Any) -> str:
+    # Compact JSON for the streaming paths (SSE events, WebSocket frames), which encode one small object per token
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
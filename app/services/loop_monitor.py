@@ -0,0 +1,116 @@
+# loop_monitor.py
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: the watchdog adds a thread and a timer callback per interval for the lifetime of the process
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "0") == "1"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+LOOP_BLOCK_HISTORY = int(os.getenv("LOOP_BLOCK_HISTORY", "50"))
+
+EVENT_LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds", "How late the loop monitor's heartbeat ran; a proxy for time spent in blocking callbacks",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+
+class LoopMonitor:
+    """
+    Detects callbacks that block the event loop. A heartbeat task on the loop wakes up every 'interval' and
+    records how late it ran; a watchdog thread notices when the heartbeat has been silent for longer than
+    'threshold' and captures the loop thread's stack while it is still blocked, which points at the culprit.
+    When the heartbeat runs again the stall is recorded with its duration and stack in 'incidents'.
+
+    When idle this costs one timer callback and one thread wakeup per interval.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD, history: int = LOOP_BLOCK_HISTORY):
+        self.interval = interval
+        self.threshold = threshold
+        self.incidents: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.blocked_total = 0
+        self._last_beat = time.monotonic()
+        self._captured_stack: Optional[List[str]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.ensure_future(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+            if lag >= self.threshold:
+                stack, self._captured_stack = self._captured_stack, None
+                self.blocked_total += 1
+                self.incidents.append({"at": time.time(), "blocked_seconds": lag, "stack": stack or []})
+                location = stack[-1].strip().splitlines()[0] if stack else "unknown location"
+                logger.warning("Event loop blocked for %.0f ms at %s", lag * 1000, location)
+
+    def _watch(self) -> None:
+        # Runs in its own thread, so it keeps going while the loop is stuck
+        while not self._stopped.wait(self.interval):
+            silent_for = time.monotonic() - self._last_beat
+            if silent_for < self.interval + self.threshold or self._captured_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured_stack = traceback.format_stack(frame)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "blocked_total": self.blocked_total,
+            "incidents": list(self.incidents),
+        }
+
+
+_loop_monitor: Optional[LoopMonitor] = None
+
+def start_loop_monitor() -> Optional[LoopMonitor]:
+    global _loop_monitor
+    if _loop_monitor is None and LOOP_MONITOR_ENABLED:
+        _loop_monitor = LoopMonitor()
+        _loop_monitor.start()
+    return _loop_monitor
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    return _loop_monitor
+
+async def stop_loop_monitor() -> None:
+    global _loop_monitor
+    if _loop_monitor is not None:
+        await _loop_monitor.stop()
+        _loop_monitor = None
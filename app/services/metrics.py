@@ -0,0 +1,198 @@
+# metrics.py
+
+import bisect
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from app.services.request_context import current_route
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Also emit OpenTelemetry spans (requires the opentelemetry-api package and a configured tracer provider)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "0") == "1"
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+TOKEN_RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 120, 160, 240, 320)
+POLL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# A collector returns (name, type, help, [(labels, value)]) tuples, read only when /metrics is scraped
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets. An observation is one bisect and three increments, so it is cheap
+    enough for the request path; everything runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = _Series(len(self.buckets) + 1)
+        # Upper bounds are inclusive, the last slot is +Inf
+        series.buckets[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, *labelvalues)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, series in self._series.items():
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(series.sum)}"
+            yield f"{self.name}_count{_format_labels(labels)} {series.count}"
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Collector] = []
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time from receiving a request to sending the last byte of the response",
+    ["route", "method", "status"]
+)
+CLIENT_METHOD_SECONDS = metrics.histogram(
+    "client_method_duration_seconds", "Time spent in a client method, including cache lookups and queueing",
+    ["client", "method", "route"]
+)
+PROMPT_BUILD_SECONDS = metrics.histogram(
+    "prompt_build_duration_seconds", "Time spent building prompts before calling the model",
+    ["method"], buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+UPSTREAM_QUEUE_SECONDS = metrics.histogram(
+    "upstream_queue_duration_seconds", "Time an upstream call waited in the client-side rate limiter",
+    ["model", "route"]
+)
+UPSTREAM_REQUEST_SECONDS = metrics.histogram(
+    "upstream_request_duration_seconds", "Upstream call latency; for streams, until the last token",
+    ["model", "route", "stream"]
+)
+TIME_TO_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "upstream_time_to_first_token_seconds", "Time from starting a streamed completion to its first token",
+    ["model", "route"]
+)
+TOKENS_PER_SECOND = metrics.histogram(
+    "upstream_completion_tokens_per_second", "Completion throughput of an upstream call (streams count content deltas)",
+    ["model", "route"], buckets=TOKEN_RATE_BUCKETS
+)
+PROMPT_TOKENS = metrics.histogram(
+    "upstream_prompt_tokens", "Prompt tokens per upstream call, as reported by the provider",
+    ["model", "route"], buckets=TOKEN_BUCKETS
+)
+COMPLETION_TOKENS = metrics.histogram(
+    "upstream_completion_tokens", "Completion tokens per upstream call, as reported by the provider",
+    ["model", "route"], buckets=TOKEN_BUCKETS
+)
+GPTS_RUN_POLLS = metrics.histogram(
+    "gpts_run_polls", "Status polls needed for an assistant run (0 when the run was streamed)",
+    ["driver"], buckets=POLL_BUCKETS
+)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    if not OTEL_ENABLED or trace is None:
+        yield
+        return
+    with trace.get_tracer("app").start_as_current_span(name, attributes=attributes):
+        yield
+
+
+def instrumented(client: str) -> Callable:
+    """
+    Decorator for async client methods: records their duration per route and wraps them in a span.
+    """
+    def decorate(func: Callable) -> Callable:
+        method = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            route = current_route.get()
+            started_at = time.perf_counter()
+            try:
+                with span(f"{client}.{method}", route=route):
+                    return await func(*args, **kwargs)
+            finally:
+                CLIENT_METHOD_SECONDS.observe(time.perf_counter() - started_at, client, method, route)
+
+        return wrapper
+    return decorate
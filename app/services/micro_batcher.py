@@ -0,0 +1,97 @@
+# micro_batcher.py
+
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+OPENAI_MICRO_BATCH_ENABLED = os.getenv("OPENAI_MICRO_BATCH_ENABLED", "0") == "1"
+OPENAI_MICRO_BATCH_MAX_SIZE = int(os.getenv("OPENAI_MICRO_BATCH_MAX_SIZE", "16"))
+OPENAI_MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("OPENAI_MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+# send(messages, n) -> n completions for the same messages
+BatchSender = Callable[[list, int], Awaitable[List[str]]]
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent completion requests for a short window and sends them upstream together.
+
+    A window closes when max_batch_size requests are waiting or max_wait seconds after its first request,
+    whichever comes first. Requests with identical messages become one upstream call asking for n choices,
+    and each caller receives its own choice; distinct requests in the window are dispatched concurrently.
+    A larger window means fewer upstream calls but more queueing latency; 'stats' shows both sides and is
+    exported on /metrics as openai_micro_batch_*.
+    """
+
+    def __init__(self, send: BatchSender, max_batch_size: int = OPENAI_MICRO_BATCH_MAX_SIZE, max_wait: float = OPENAI_MICRO_BATCH_MAX_WAIT_MS / 1000):
+        self.send = send
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, list, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "windows": 0,
+            "upstream_calls": 0,
+            "queue_seconds_total": 0.0,
+            "largest_window": 0,
+        }
+
+    async def submit(self, messages: list) -> str:
+        key = json.dumps(messages, sort_keys=True, default=str)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((key, messages, future, time.perf_counter()))
+        self.stats["requests"] += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        now = time.perf_counter()
+        self.stats["windows"] += 1
+        self.stats["largest_window"] = max(self.stats["largest_window"], len(pending))
+
+        groups: Dict[str, Tuple[list, List[asyncio.Future]]] = {}
+        for key, messages, future, queued_at in pending:
+            self.stats["queue_seconds_total"] += now - queued_at
+            if not future.done():
+                groups.setdefault(key, (messages, []))[1].append(future)
+
+        for messages, futures in groups.values():
+            if futures:
+                self.stats["upstream_calls"] += 1
+                asyncio.ensure_future(self._dispatch(messages, futures))
+
+    async def _dispatch(self, messages: list, futures: List[asyncio.Future]) -> None:
+        try:
+            choices = await self.send(messages, len(futures))
+            if not choices:
+                raise ValueError("Upstream returned no choices")
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, future in enumerate(futures):
+            if not future.done():
+                # Fewer choices than asked for (shouldn't happen) still gives every caller an answer
+                future.set_result(choices[index] if index < len(choices) else choices[-1])
+
+
+def micro_batcher_from_env(send: BatchSender) -> Optional[MicroBatcher]:
+    return MicroBatcher(send) if OPENAI_MICRO_BATCH_ENABLED else None
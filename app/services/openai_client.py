@@ -1,110 +1,323 @@
 # openai_client.py
 
+import logging
 import os
+import time
+import weakref
+from typing import AsyncIterator, Callable, List, Optional
+
+import httpx
 import openai
 from enum import Enum
 
+from app.services.client_registry import client_registry
+from app.services.completion_cache import CompletionCache, get_completion_cache
+from app.services.context_window import OPENAI_CONTEXT_SUMMARIZE, SUMMARY_PROMPT, ContextWindow, context_budget
+from app.services.hedging import HedgingPolicy
+from app.services.metrics import (
+    COMPLETION_TOKENS, PROMPT_TOKENS, TIME_TO_FIRST_TOKEN_SECONDS, TOKENS_PER_SECOND, UPSTREAM_QUEUE_SECONDS,
+    UPSTREAM_REQUEST_SECONDS, instrumented, metrics
+)
+from app.services.micro_batcher import MicroBatcher, micro_batcher_from_env
+from app.services.rate_limiter import RateLimiter, call_with_retries, get_rate_limiter
+from app.services.request_context import current_route
+
+logger = logging.getLogger(__name__)
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Connection pool settings for the process-wide upstream HTTP client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "500"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "100"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_WARMUP = os.getenv("OPENAI_WARMUP", "1") == "1"
+
 class OpenAIModel(str, Enum):
     GPT_3 = "gpt-3.5-turbo"
     GPT_3_5 = "gpt-3.5-turbo"
     GPT_4 = "gpt-4"
 
+
+_async_openai: Optional[openai.AsyncOpenAI] = None
+
+def get_async_openai() -> openai.AsyncOpenAI:
+    """
+    Returns the process-wide AsyncOpenAI instance. Every OpenAIClient shares its pooled
+    httpx transport, so keep-alive connections (and their TLS sessions) are reused across requests.
+    """
+    global _async_openai
+    if _async_openai is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=OPENAI_TIMEOUT,
+        )
+        # Retries are handled by call_with_retries so they go through the shared rate limiter
+        _async_openai = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+    return _async_openai
+
+async def warm_async_openai() -> None:
+    """
+    Opens a connection to the upstream at startup so the first request does not pay for the TLS handshake.
+    Failures are ignored; the pool will simply connect lazily instead.
+    """
+    client = get_async_openai()
+    if not OPENAI_WARMUP or not OPENAI_API_KEY:
+        return
+    try:
+        await client.models.list()
+    except openai.OpenAIError as e:
+        logger.warning("OpenAI warm-up failed: %s", e)
+
+async def close_async_openai() -> None:
+    global _async_openai
+    if _async_openai is not None:
+        await _async_openai.close()
+        _async_openai = None
+
 def get_openai_client(model: OpenAIModel = OpenAIModel.GPT_3_5, temperature: float = 0.7, max_tokens: int = 250):
-    return OpenAIClient(api_key=OPENAI_API_KEY, model=model, temperature=temperature, max_tokens=max_tokens)
+    # For use inside the services only: every distinct configuration becomes a client that lives as long as the
+    # process, so these values must never come from a request (routes depend on get_default_openai_client)
+    return client_registry.get_or_create(
+        ("openai", OpenAIModel(model).value, temperature, max_tokens),
+        lambda: OpenAIClient(
+            api_key=OPENAI_API_KEY,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache=get_completion_cache(),
+            hedging=HedgingPolicy.from_env(),
+            rate_limiter=get_rate_limiter()
+        )
+    )
+
+def get_default_openai_client():
+    # Route dependency: takes no parameters, so FastAPI does not turn the client configuration into query parameters
+    return get_openai_client()
+
+
+def record_usage(response, seconds: float, model: str, route: str) -> None:
+    UPSTREAM_REQUEST_SECONDS.observe(seconds, model, route, "false")
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    PROMPT_TOKENS.observe(usage.prompt_tokens, model, route)
+    COMPLETION_TOKENS.observe(usage.completion_tokens, model, route)
+    if seconds > 0:
+        TOKENS_PER_SECOND.observe(usage.completion_tokens / seconds, model, route)
+
+
+# Every OpenAIClient, so their micro-batcher and hedging counters can be exported
+_openai_clients: "weakref.WeakSet[OpenAIClient]" = weakref.WeakSet()
+
+def _client_samples():
+    # Exposes the micro-batching and hedging counters of each client configuration on /metrics
+    batch = {name: [] for name in ("requests", "windows", "upstream_calls", "queue_seconds_total", "largest_window")}
+    hedges_sent, hedges_won = [], []
+    for client in list(_openai_clients):
+        labels = {
+            "model": getattr(client.model, "value", client.model),
+            "temperature": str(client.temperature),
+            "max_tokens": str(client.max_tokens),
+        }
+        if client.micro_batcher is not None:
+            for name, value in client.micro_batcher.stats.items():
+                batch[name].append((labels, value))
+        if client.hedging is not None:
+            hedges_sent.append((labels, client.hedging.hedges_sent))
+            hedges_won.append((labels, client.hedging.hedges_won))
+
+    families = []
+    if batch["requests"]:
+        families += [
+            ("openai_micro_batch_requests_total", "counter", "Requests submitted to the micro-batcher", batch["requests"]),
+            ("openai_micro_batch_windows_total", "counter", "Micro-batch windows flushed", batch["windows"]),
+            ("openai_micro_batch_upstream_calls_total", "counter", "Upstream calls made for micro-batched requests", batch["upstream_calls"]),
+            ("openai_micro_batch_queue_seconds_total", "counter", "Total time requests waited for their window to close", batch["queue_seconds_total"]),
+            ("openai_micro_batch_largest_window", "gauge", "Most requests seen in one window", batch["largest_window"]),
+        ]
+    if hedges_sent:
+        families += [
+            ("openai_hedged_requests_total", "counter", "Duplicate requests sent because the first one was slow", hedges_sent),
+            ("openai_hedged_requests_won_total", "counter", "Hedged requests that answered before the original", hedges_won),
+        ]
+    return families
+
+metrics.register_collector(_client_samples)
 
 
 class OpenAIClient:
-    
-    def __init__(self, api_key: str, model: OpenAIModel = OpenAIModel.GPT_3_5, temperature: float = 0.7, max_tokens: int = 250):
+
+    def __init__(self, api_key: str, model: OpenAIModel = OpenAIModel.GPT_3_5, temperature: float = 0.7, max_tokens: int = 250, client: openai.AsyncOpenAI = None, cache: CompletionCache = None, hedging: HedgingPolicy = None, rate_limiter: RateLimiter = None, micro_batch: bool = None):
         self.api_key = api_key
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
-        openai.api_key = self.api_key
-    
-    def single_response(self, prompt: str):
-        messages = [{"role": "user", "content": prompt}]
-        
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens
-        )
-        
-        return response.choices[0].message["content"]
-    
-    def server_and_user_message_response(self, server_prompt: str, user_prompt: str):
-        messages = [{"role": "system", "content": server_prompt}, {"role": "user", "content": user_prompt}]
-        
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens
+        self.client = client or get_async_openai()
+        self.cache = cache
+        self.hedging = hedging
+        self.rate_limiter = rate_limiter
+        # Opt-in: concurrent single_response calls are gathered into short windows and sent together
+        if micro_batch is None:
+            self.micro_batcher: Optional[MicroBatcher] = micro_batcher_from_env(self._request_choices)
+        else:
+            self.micro_batcher = MicroBatcher(self._request_choices) if micro_batch else None
+        _openai_clients.add(self)
+        model_name = getattr(model, "value", model)
+        self.context_window = ContextWindow(
+            model_name,
+            budget=context_budget(model_name, max_tokens),
+            summarizer=self.summarize if OPENAI_CONTEXT_SUMMARIZE else None
         )
-        
-        return response.choices[0].message["content"]
-    
-    def conversation_response(self, messages: list):
-                
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens
-        )
-        
-        return response.choices[0].message["content"]
 
-    def single_response_stream(self, prompt: str):
+    async def _create(self, messages: list, model: str, stream: bool = False, n: int = 1):
+        """
+        Sends one chat completion request through the shared rate limiter, retrying 429s and transient
+        failures. The limiter is kept in sync with the provider's rate-limit response headers.
+        """
+        options = {"n": n} if n > 1 else {}
+        model_name = getattr(model, "value", model)
+        route = current_route.get()
+        limiter = None
+        if self.rate_limiter is not None:
+            limiter = self.rate_limiter.for_model(model)
+            estimated_tokens = self.context_window.counter.count_messages(messages) + self.max_tokens * n
+
+        async def attempt():
+            if limiter is not None:
+                UPSTREAM_QUEUE_SECONDS.observe(await self.rate_limiter.acquire(model, estimated_tokens), model_name, route)
+            started_at = time.perf_counter()
+            raw_response = await self.client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=stream,
+                **options
+            )
+            if limiter is not None:
+                limiter.update_from_headers(raw_response.headers)
+            response = raw_response.parse()
+            if not stream:
+                record_usage(response, time.perf_counter() - started_at, model_name, route)
+            return response
+
+        return await call_with_retries(attempt, on_rate_limited=limiter.block_for if limiter is not None else None)
+
+    async def _request(self, messages: list, model: str) -> str:
+        response = await self._create(messages, model)
+
+        return response.choices[0].message.content
+
+    async def _request_choices(self, messages: list, n: int) -> List[str]:
+        response = await self._create(messages, self.model, n=n)
+
+        return [choice.message.content for choice in sorted(response.choices, key=lambda choice: choice.index)]
+
+    async def _complete(self, messages: list, batched: bool = False) -> str:
+        if self.cache is not None:
+            cached = await self.cache.get(self.model, messages, self.temperature, self.max_tokens)
+            if cached is not None:
+                return cached
+
+        if batched and self.micro_batcher is not None:
+            content = await self.micro_batcher.submit(messages)
+        elif self.hedging is not None:
+            content = await self.hedging.race(lambda model: self._request(messages, model), self.model)
+        else:
+            content = await self._request(messages, self.model)
+
+        if self.cache is not None:
+            await self.cache.set(self.model, messages, self.temperature, self.max_tokens, content)
+
+        return content
+
+    @instrumented("openai")
+    async def single_response(self, prompt: str):
         messages = [{"role": "user", "content": prompt}]
-        
-        # Initiates the stream and specifies a callback function to handle the stream's output
-        stream = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stream=True
-        )
-        
-        for response in stream:
-            message_content = response.choices[0].delta.content
-            if message_content:
-                yield message_content
-                
-    async def server_and_user_message_response_stream(self, server_prompt: str, user_prompt: str):
+
+        return await self._complete(messages, batched=True)
+
+    @instrumented("openai")
+    async def server_and_user_message_response(self, server_prompt: str, user_prompt: str):
         messages = [{"role": "system", "content": server_prompt}, {"role": "user", "content": user_prompt}]
-        
-        # Initiates the stream and specifies a callback function to handle the stream's output
-        stream = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stream=True
-        )
-        
-        for response in stream:
-            message_content = response.choices[0].delta.content
-            if message_content:
-                yield message_content
-                
-    async def conversation_response_stream(self, messages: list):
-                    
-        # Initiates the stream and specifies a callback function to handle the stream's output
-        stream = openai.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stream=True
-        )
-        
-        for response in stream:
-            message_content = response.choices[0].delta.content
-            if message_content:
+
+        return await self._complete(messages)
+
+    @instrumented("openai")
+    async def conversation_response(self, messages: list):
+        messages = await self.context_window.fit(messages)
+
+        return await self._complete(messages)
+
+    @instrumented("openai")
+    async def summarize(self, messages: list) -> str:
+        conversation = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+        return await self._complete([{"role": "user", "content": SUMMARY_PROMPT.format(conversation=conversation)}])
+
+    async def _request_stream(self, messages: list, model: str) -> AsyncIterator[str]:
+        stream = await self._create(messages, model, stream=True)
+
+        try:
+            async for response in stream:
+                if not response.choices:
+                    continue
+                message_content = response.choices[0].delta.content
+                if message_content:
+                    yield message_content
+        finally:
+            await stream.close()
+
+    async def _stream(self, messages: list, on_first_token: Optional[Callable[[float], None]] = None, fit_context: bool = False) -> AsyncIterator[str]:
+        """
+        Yields content deltas as they arrive from the upstream stream. Closing the generator (e.g. when the
+        client disconnects) closes the upstream response, which cancels the request with the provider.
+        on_first_token, if given, is called once with the time-to-first-token in seconds.
+        """
+        started_at = time.perf_counter()
+        model_name = getattr(self.model, "value", self.model)
+        route = current_route.get()
+        if fit_context:
+            messages = await self.context_window.fit(messages)
+
+        if self.hedging is not None:
+            tokens = self.hedging.race_stream(lambda model: self._request_stream(messages, model), self.model)
+        else:
+            tokens = self._request_stream(messages, self.model)
+
+        first_token_at = None
+        deltas = 0
+        try:
+            async for message_content in tokens:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token_at - started_at, model_name, route)
+                    if on_first_token is not None:
+                        on_first_token(first_token_at - started_at)
+                deltas += 1
                 yield message_content
+        finally:
+            await tokens.aclose()
+            finished_at = time.perf_counter()
+            UPSTREAM_REQUEST_SECONDS.observe(finished_at - started_at, model_name, route, "true")
+            if first_token_at is not None and finished_at > first_token_at:
+                TOKENS_PER_SECOND.observe(deltas / (finished_at - first_token_at), model_name, route)
+
+    def single_response_stream(self, prompt: str, on_first_token: Optional[Callable[[float], None]] = None) -> AsyncIterator[str]:
+        messages = [{"role": "user", "content": prompt}]
+
+        return self._stream(messages, on_first_token=on_first_token)
+
+    def server_and_user_message_response_stream(self, server_prompt: str, user_prompt: str, on_first_token: Optional[Callable[[float], None]] = None) -> AsyncIterator[str]:
+        messages = [{"role": "system", "content": server_prompt}, {"role": "user", "content": user_prompt}]
+
+        return self._stream(messages, on_first_token=on_first_token)
+
+    def conversation_response_stream(self, messages: list, on_first_token: Optional[Callable[[float], None]] = None) -> AsyncIterator[str]:
+
+        return self._stream(messages, on_first_token=on_first_token, fit_context=True)
@@ -0,0 +1,92 @@
+# prompt_builder.py
+
+from string import Formatter
+from typing import List, Tuple
+
+from app.models.schemas import ConversationModel, Issue, Message, Role
+from app.services.context_window import TokenCounter
+from app.services.ttl_cache import TTLCache
+
+
+class CompiledTemplate:
+    """
+    A str.format template parsed once into literal chunks and field names, so rendering is a single join
+    without re-parsing the format string on every call. Only plain {name} fields are supported.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._chunks: List[str] = []
+        self._fields: List[str] = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(template):
+            if format_spec or conversion:
+                raise ValueError(f"Unsupported field in template: {{{field_name}}}")
+            self._chunks.append(literal)
+            if field_name is not None:
+                self._fields.append(field_name)
+
+    def render(self, **values: str) -> str:
+        parts = []
+        for index, literal in enumerate(self._chunks):
+            parts.append(literal)
+            if index < len(self._fields):
+                parts.append(values[self._fields[index]])
+        return "".join(parts)
+
+
+def format_message(message: Message) -> str:
+    if message.role == Role.SYSTEM:
+        return f"ASSISTANT: {message.content.upper()}"
+    return f"user: {message.content.lower()}"
+
+
+def format_issue(issue: Issue) -> str:
+    return f"issueID: {issue.issue_id}, issueName: {issue.issue_name}, issueDescription: {issue.issue_description}"
+
+
+class PromptBuilder:
+    """
+    Renders the pieces of the issue-matching prompts with as little repeated work as possible:
+    - issue blocks are memoised per issue-set fingerprint,
+    - formatted message lines are memoised per (role, content), so a transcript only formats the messages
+      that were not seen before (e.g. the new turn of a conversation) and joins the rest,
+    - long transcripts can be cut to a token budget, keeping the latest turns.
+    """
+
+    def __init__(self, line_cache_size: int = 10000):
+        self._issue_blocks: TTLCache[str] = TTLCache(maxsize=256, ttl=float("inf"))
+        self._lines: TTLCache[str] = TTLCache(maxsize=line_cache_size, ttl=float("inf"))
+
+    def issue_block(self, issues: List[Issue]) -> str:
+        fingerprint: Tuple = tuple((issue.issue_id, issue.issue_name, issue.issue_description) for issue in issues)
+        block = self._issue_blocks.get(fingerprint)
+        if block is None:
+            block = "\n".join(format_issue(issue) for issue in issues)
+            self._issue_blocks.set(fingerprint, block)
+        return block
+
+    def _line(self, message: Message) -> str:
+        key = (message.role, message.content)
+        line = self._lines.get(key)
+        if line is None:
+            line = format_message(message)
+            self._lines.set(key, line)
+        return line
+
+    def transcript(self, conversation: ConversationModel) -> str:
+        return "\n".join(self._line(message) for message in conversation.messages)
+
+    def fitted_transcript(self, conversation: ConversationModel, counter: TokenCounter, budget: int) -> str:
+        """
+        The transcript of the latest messages that fit in budget tokens. The last message is always kept, as
+        ContextWindow does for conversations sent as chat messages.
+        """
+        lines: List[str] = []
+        total = 0
+        for message in reversed(conversation.messages):
+            line = self._line(message)
+            total += counter.count_text(line) + 1  # and the newline joining it to the next line
+            if lines and total > budget:
+                break
+            lines.append(line)
+        return "\n".join(reversed(lines))
@@ -0,0 +1,249 @@
+# rate_limiter.py
+
+import asyncio
+import email.utils
+import heapq
+import itertools
+import math
+import os
+import random
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+
+import openai
+
+from app.services.request_context import request_priority
+
+T = TypeVar("T")
+
+OPENAI_RATE_LIMIT_ENABLED = os.getenv("OPENAI_RATE_LIMIT_ENABLED", "1") == "1"
+# Starting limits per model, until the provider's rate-limit headers tell us the real ones
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "90000"))
+
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20"))
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    # Rate-limit reset headers look like "20ms", "1s" or "6m0s"
+    parts = DURATION_PATTERN.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    if headers is None:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            seconds = float(retry_after_ms) / 1000
+            if math.isfinite(seconds):
+                return max(0.0, seconds)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        seconds = float(retry_after)
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    # Otherwise an HTTP date; a malformed header must not turn a retryable error into a crash
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+
+class TokenBucket:
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.refill_per_second = per_minute / 60
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def update(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]) -> None:
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.refill_per_second = limit / 60
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            # The provider says the bucket refills completely by reset_seconds
+            if reset_seconds and remaining < self.capacity:
+                self.refill_per_second = max(self.refill_per_second, (self.capacity - remaining) / reset_seconds)
+
+
+class ModelLimiter:
+    """
+    Request and token buckets for one model, plus a priority queue of waiting callers. Lower priority
+    numbers are served first; callers of equal priority are served in arrival order.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.blocked_until = 0.0
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens), self.blocked_until - time.monotonic())
+
+    def _consume(self, tokens: float) -> None:
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+
+    async def acquire(self, tokens: float, priority: int) -> float:
+        """
+        Waits until the request fits the model's limits and returns how long it was queued, in seconds.
+        """
+        if not self._waiters and self._wait_time(tokens) <= 0:
+            self._consume(tokens)
+            return 0.0
+
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, future))
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        await future
+        return time.monotonic() - started_at
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = self._wait_time(tokens)
+            if wait <= 0:
+                heapq.heappop(self._waiters)
+                self._consume(tokens)
+                future.set_result(None)
+                continue
+
+            # Sleep until capacity is back, or until a new (possibly higher priority) waiter arrives
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        def number(name: str) -> Optional[float]:
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.update(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.update(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def block_for(self, seconds: float) -> None:
+        # After a 429 nobody else should go out before the provider's Retry-After has passed
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Client-side limiter shared by every OpenAIClient: one ModelLimiter per model, created on first use with the
+    configured starting limits and then adapted to the rate-limit headers of each response.
+    """
+
+    def __init__(self, requests_per_minute: float = OPENAI_REQUESTS_PER_MINUTE, tokens_per_minute: float = OPENAI_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.models: Dict[str, ModelLimiter] = {}
+
+    def for_model(self, model: str) -> ModelLimiter:
+        model = getattr(model, "value", model)
+        limiter = self.models.get(model)
+        if limiter is None:
+            limiter = self.models[model] = ModelLimiter(self.requests_per_minute, self.tokens_per_minute)
+        return limiter
+
+    async def acquire(self, model: str, tokens: float, priority: int = None) -> float:
+        return await self.for_model(model).acquire(tokens, request_priority.get() if priority is None else priority)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+async def call_with_retries(call: Callable[[], Awaitable[T]], on_rate_limited: Callable[[float], None] = None, max_retries: int = OPENAI_MAX_RETRIES) -> T:
+    """
+    Retries 429s, 5xx responses and connection errors with jittered exponential backoff. A Retry-After
+    header from the provider takes precedence over the computed delay.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+
+            delay = random.uniform(0, min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+            retry_after = parse_retry_after(getattr(getattr(e, "response", None), "headers", None))
+            if retry_after is not None:
+                delay = min(retry_after, OPENAI_RETRY_MAX_DELAY)
+            if isinstance(e, openai.RateLimitError) and on_rate_limited is not None:
+                on_rate_limited(delay)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    global _rate_limiter
+    if _rate_limiter is None and OPENAI_RATE_LIMIT_ENABLED:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,15 @@
+# request_context.py
+
+from contextvars import ContextVar
+
+# Queue priorities for upstream calls; lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BATCH = 10
+
+# Path of the route currently being served, set by the middleware in app/main.py.
+# Services use it to label per-route statistics without threading the route through every call.
+current_route: ContextVar[str] = ContextVar("current_route", default="internal")
+
+# Priority of the current request in the upstream rate limiter queue
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_DEFAULT)
@@ -0,0 +1,387 @@
+# loadgen.py
+#
+# Load generator for the app's HTTP, SSE and WebSocket routes:
+#
+#   python -m bench.mock_openai --port 8001 &
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock uvicorn main:app --port 8000 &
+#   python -m bench.loadgen --url http://127.0.0.1:8000 --concurrency 32 --duration 30 --save-baseline baseline.json
+#   ... change something, restart the app ...
+#   python -m bench.loadgen --url http://127.0.0.1:8000 --concurrency 32 --duration 30 --baseline baseline.json
+#
+# Each worker runs the selected scenarios round-robin in a closed loop (or at a fixed total --rate, open loop).
+# The report has per-scenario RPS, error counts, p50/p95/p99 latency and, for streaming routes, time to first
+# token. The load generator also measures its own event-loop lag: if that is high, the client, not the server,
+# was the bottleneck and the run should not be compared. The server's own loop lag is read from the loop
+# monitor's histogram on /metrics when the app runs with LOOP_MONITOR_ENABLED=1. With --baseline, each scenario is compared against a
+# stored run and the exit status is 1 when any of them regressed by more than --tolerance.
+# The WebSocket scenarios need the 'websockets' package; they are skipped when it is not installed.
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+ISSUES = [
+    {"issue_id": "1", "issue_name": "Delayed Order Pick-ups", "issue_description": "Customers are complaining that their orders are not being picked up on time."},
+    {"issue_id": "2", "issue_name": "Kit Processing", "issue_description": "Customers are complaining that their kits are not being processed correctly."},
+    {"issue_id": "3", "issue_name": "Account Balance problems", "issue_description": "Customers want to know about their account balance, or it's not showing up correctly or being updated correctly."},
+    {"issue_id": "4", "issue_name": "Order Status", "issue_description": "Customers want to know the status of their orders."},
+]
+USER_MESSAGES = [
+    "My order was supposed to be picked up yesterday and nobody came.",
+    "Can you tell me where my order is right now?",
+    "The kit I sent in still shows as not processed.",
+    "My account balance did not update after the refund.",
+    "I have a question about something else entirely.",
+    "Why is the pickup for order 4411 late again?",
+]
+
+LAG_INTERVAL = 0.05
+# Server-side loop lag, from the histogram the app's loop monitor exports on /metrics
+SERVER_LAG_PATTERN = re.compile(r'^event_loop_lag_seconds_(sum|count|bucket\{le="0\.1"\}) (\S+)$', re.MULTILINE)
+
+
+class Stats:
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.errors = 0
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "rps": len(latencies) / duration if duration > 0 else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+        }
+
+
+def percentile(ordered: List[float], percent: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(len(ordered) * percent / 100 + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoadGenerator:
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.ws_url = args.url.replace("http://", "ws://").replace("https://", "wss://")
+        self.http = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency),
+        )
+        self.request_ids = itertools.count()
+        self.stats: Dict[str, Stats] = {}
+        self.loop_lag: List[float] = []
+        self.recording = False
+
+    # Payloads
+
+    def conversation(self) -> Dict[str, Any]:
+        return {"messages": [{"role": "user", "content": self.rng.choice(USER_MESSAGES)}]}
+
+    def prompt(self) -> str:
+        return f"{self.rng.choice(USER_MESSAGES)} (#{self.rng.randrange(1000)})"
+
+    # Scenarios: each returns the time to first token for streams, None otherwise, and raises on failure
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> None:
+        response = await self.http.post(path, json=payload)
+        response.raise_for_status()
+
+    async def post_stream(self, path: str, payload: Dict[str, Any], started_at: float) -> Optional[float]:
+        ttft = None
+        async with self.http.stream("POST", path, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:") and ttft is None and '"delta"' in line:
+                    ttft = time.perf_counter() - started_at
+                elif line.startswith("event: error"):
+                    raise RuntimeError("stream ended with an error event")
+                elif line.startswith("event: done"):
+                    break
+        return ttft
+
+    async def ws_request(self, path: str, message: Dict[str, Any], started_at: float, connections: Dict[str, Any]) -> Optional[float]:
+        connection = connections.get(path)
+        if connection is None:
+            connection = connections[path] = await websockets.connect(self.ws_url + path)
+
+        request_id = str(next(self.request_ids))
+        await connection.send(json.dumps({**message, "request_id": request_id}))
+        ttft = None
+        while True:
+            reply = json.loads(await connection.recv())
+            if reply.get("request_id") != request_id:
+                continue
+            kind = reply.get("type")
+            if kind == "delta" and ttft is None:
+                ttft = time.perf_counter() - started_at
+            elif kind == "tool_call":
+                await connection.send(json.dumps({
+                    "type": "tool_output", "request_id": request_id, "call_id": reply["call_id"], "output": "{\"status\": \"ok\"}"
+                }))
+            elif kind in ("done", "result"):
+                return ttft
+            elif kind in ("error", "cancelled"):
+                raise RuntimeError(reply.get("detail", kind))
+
+    def scenarios(self) -> Dict[str, Callable[[float, Dict[str, Any]], Any]]:
+        scenarios = {
+            "generate.single": lambda t, c: self.post("/generate/single", {"prompt": self.prompt()}),
+            "generate.server_and_user": lambda t, c: self.post("/generate/server-and-user", {
+                "server_prompt": "You are a helpful support agent.", "user_prompt": self.prompt()
+            }),
+            "generate.conversation": lambda t, c: self.post("/generate/conversation", self.conversation()),
+            "generate.single_stream": lambda t, c: self.post_stream("/generate/single/stream", {"prompt": self.prompt()}, t),
+            "generate.server_and_user_stream": lambda t, c: self.post_stream("/generate/server-and-user/stream", {
+                "server_prompt": "You are a helpful support agent.", "user_prompt": self.prompt()
+            }, t),
+            "generate.conversation_stream": lambda t, c: self.post_stream("/generate/conversation/stream", self.conversation(), t),
+            "chat.find_issue": lambda t, c: self.post("/chat/find-issue", {"conversation": self.conversation(), "issues": ISSUES}),
+            "chat.find_issue_batch": lambda t, c: self.post("/chat/find-issue/batch", {
+                "conversations": [self.conversation() for _ in range(self.args.batch_size)], "issues": ISSUES
+            }),
+            "chat.conversation": lambda t, c: self.post("/chat/conversation", {"conversation": self.conversation()}),
+        }
+        if websockets is not None:
+            scenarios["ws.generate"] = lambda t, c: self.ws_request("/ws/generate", {"type": "single", "prompt": self.prompt()}, t, c)
+            scenarios["ws.gpts"] = lambda t, c: self.ws_request("/ws/gpts", {
+                "type": "single", "assistant_id": self.args.assistant_id, "prompt": self.prompt()
+            }, t, c)
+        return scenarios
+
+    # Running
+
+    async def run_one(self, name: str, scenario: Callable, connections: Dict[str, Any]) -> None:
+        started_at = time.perf_counter()
+        stats = self.stats.setdefault(name, Stats())
+        try:
+            ttft = await scenario(started_at, connections)
+        except Exception as e:
+            if self.recording:
+                stats.errors += 1
+                if self.args.verbose:
+                    print(f"{name}: {e!r}", file=sys.stderr)
+            return
+        if self.recording:
+            stats.latencies.append(time.perf_counter() - started_at)
+            if ttft is not None:
+                stats.ttfts.append(ttft)
+
+    async def worker(self, selected: List[Tuple[str, Callable]], offset: int, deadline: float) -> None:
+        connections: Dict[str, Any] = {}
+        try:
+            for name, scenario in itertools.islice(itertools.cycle(selected), offset, None):
+                if time.perf_counter() >= deadline:
+                    break
+                await self.run_one(name, scenario, connections)
+        finally:
+            for connection in connections.values():
+                await connection.close()
+
+    async def open_loop(self, selected: List[Tuple[str, Callable]], deadline: float) -> None:
+        # Requests start on a fixed schedule no matter how long earlier ones take, up to --concurrency in flight
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        tasks = set()
+        interval = 1 / self.args.rate
+        next_start = time.perf_counter()
+
+        async def limited(name: str, scenario: Callable) -> None:
+            async with semaphore:
+                await self.run_one(name, scenario, {})
+
+        for name, scenario in itertools.cycle(selected):
+            if next_start >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            task = asyncio.ensure_future(limited(name, scenario))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_start += interval
+        await asyncio.gather(*tasks)
+
+    async def monitor_loop_lag(self) -> None:
+        while True:
+            expected = time.perf_counter() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            if self.recording:
+                self.loop_lag.append(max(0.0, time.perf_counter() - expected))
+
+    async def scrape_server_lag(self) -> Dict[str, float]:
+        try:
+            response = await self.http.get("/metrics")
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return {}
+        return {name: float(value) for name, value in SERVER_LAG_PATTERN.findall(response.text)}
+
+    async def run(self) -> Dict[str, Any]:
+        available = self.scenarios()
+        names = self.args.scenarios.split(",") if self.args.scenarios else list(available)
+        missing = [name for name in names if name not in available]
+        if missing:
+            raise SystemExit(f"Unknown or unavailable scenarios: {', '.join(missing)} (available: {', '.join(available)})")
+        selected = [(name, available[name]) for name in names]
+
+        elapsed = 0.0
+        server_lag_before: Dict[str, float] = {}
+        server_lag_after: Dict[str, float] = {}
+        monitor = asyncio.ensure_future(self.monitor_loop_lag())
+        try:
+            for phase, duration in (("warmup", self.args.warmup), ("measure", self.args.duration)):
+                if duration <= 0:
+                    continue
+                self.recording = phase == "measure"
+                if self.recording:
+                    server_lag_before = await self.scrape_server_lag()
+                started_at = time.perf_counter()
+                deadline = started_at + duration
+                if self.args.rate:
+                    await self.open_loop(selected, deadline)
+                else:
+                    await asyncio.gather(*[
+                        self.worker(selected, offset, deadline) for offset in range(self.args.concurrency)
+                    ])
+                elapsed = time.perf_counter() - started_at
+            server_lag_after = await self.scrape_server_lag()
+        finally:
+            monitor.cancel()
+            await self.http.aclose()
+
+        server_lag = None
+        if server_lag_before and server_lag_after:
+            beats = server_lag_after["count"] - server_lag_before["count"]
+            on_time = server_lag_after['bucket{le="0.1"}'] - server_lag_before['bucket{le="0.1"}']
+            server_lag = {
+                "mean": (server_lag_after["sum"] - server_lag_before["sum"]) / beats if beats else None,
+                "over_100ms": beats - on_time,
+            }
+
+        lag = sorted(self.loop_lag)
+        return {
+            "config": {
+                "url": self.args.url,
+                "concurrency": self.args.concurrency,
+                "rate": self.args.rate,
+                "duration": self.args.duration,
+            },
+            "elapsed": elapsed,
+            "loop_lag": {"p50": percentile(lag, 50), "p99": percentile(lag, 99), "max": lag[-1] if lag else None},
+            "server_loop_lag": server_lag,
+            "scenarios": {name: self.stats[name].to_dict(elapsed) for name in names if name in self.stats},
+        }
+
+
+def milliseconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'scenario':34} {'reqs':>7} {'errs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft50':>8} {'ttft95':>8}")
+    for name, stats in report["scenarios"].items():
+        print(
+            f"{name:34} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+            f"{milliseconds(stats['p50']):>9} {milliseconds(stats['p95']):>9} {milliseconds(stats['p99']):>9} "
+            f"{milliseconds(stats['ttft_p50']):>8} {milliseconds(stats['ttft_p95']):>8}"
+        )
+    total = sum(stats["requests"] for stats in report["scenarios"].values())
+    lag = report["loop_lag"]
+    print(f"total {total} requests, {total / report['elapsed']:.1f} rps over {report['elapsed']:.1f}s")
+    print(f"load generator loop lag: p50 {milliseconds(lag['p50'])} ms, p99 {milliseconds(lag['p99'])} ms, max {milliseconds(lag['max'])} ms")
+    if lag["p99"] is not None and lag["p99"] > 0.05:
+        print("warning: the load generator itself is saturated; lower --concurrency or run it on another machine")
+    server_lag = report.get("server_loop_lag")
+    if server_lag:
+        print(f"server loop lag: mean {milliseconds(server_lag['mean'])} ms, {server_lag['over_100ms']:.0f} heartbeats more than 100 ms late")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """
+    Prints the change of each metric against the baseline and returns True when nothing regressed by more
+    than the tolerance (throughput down, or latency up).
+    """
+    ok = True
+    print(f"\ncompared with baseline (tolerance {tolerance:.0%}):")
+    for name, stats in report["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            print(f"{name:34} no baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in (("rps", True), ("p50", False), ("p95", False), ("p99", False), ("ttft_p50", False)):
+            if not stats[metric] or not previous[metric]:
+                continue
+            change = stats[metric] / previous[metric] - 1
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            ok = ok and not regressed
+            changes.append(f"{metric} {change:+.1%}{' REGRESSED' if regressed else ''}")
+        print(f"{name:34} {', '.join(changes)}")
+    return ok
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load generator for the app's routes")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop workers, or the in-flight cap with --rate")
+    parser.add_argument("--rate", type=float, help="Open loop: total requests per second to start")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--batch-size", type=int, default=10, help="Conversations per /chat/find-issue/batch request")
+    parser.add_argument("--assistant-id", default="asst_mock")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--save-baseline", help="Store the report as the baseline for later runs")
+    parser.add_argument("--baseline", help="Compare against a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+async def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    if websockets is None:
+        print("websockets is not installed; skipping the WebSocket scenarios", file=sys.stderr)
+
+    report = await LoadGenerator(args).run()
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return 0 if compare(report, baseline, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
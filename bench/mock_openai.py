@@ -0,0 +1,455 @@
+# mock_openai.py
+#
+# Local stand-in for the OpenAI API, for benchmarks and for running the app without a key:
+#
+#   python -m bench.mock_openai --port 8001 --latency lognormal:0.4,0.5 --tokens-per-second 60 --error-rate 0.01
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock uvicorn main:app
+#
+# Implements chat completions (buffered, streamed and n > 1), models.list, assistants threads/messages/runs
+# (streamed and polled, with optional tool calls) and the files/batches endpoints used by app.jobs.bulk_generate.
+# Latencies are drawn from configurable distributions, tokens are emitted at a configurable rate, and a share
+# of requests can be failed with 500s or 429s. A fixed --seed makes runs reproducible.
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import math
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WORDS = "the order kit account balance status pickup delayed customer support update processed".split()
+BATCH_CONVERSATION_PATTERN = re.compile(r"^CONVERSATION (\d+):", re.MULTILINE)
+
+
+class Distribution:
+    """
+    Latency distribution parsed from "fixed:S", "uniform:LOW,HIGH", "exponential:MEAN" or "lognormal:MEDIAN,SIGMA"
+    (all in seconds).
+    """
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value]
+        if kind not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.params[0])
+        return rng.lognormvariate(math.log(self.params[0]), self.params[1])
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(str(value) for value in self.params)}"
+
+
+class MockOpenAI:
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latency = Distribution(args.latency)
+        self.run_latency = Distribution(args.run_latency)
+        self.ids = itertools.count(1)
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self.ids):08d}"
+
+    # Errors and content
+
+    def injected_error(self) -> Optional[Response]:
+        self.requests += 1
+        roll = self.rng.random()
+        if roll < self.args.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(self.args.retry_after * 1000))},
+            )
+        if roll < self.args.rate_limit_rate + self.args.error_rate:
+            return JSONResponse({"error": {"message": "Internal error (mock)", "type": "server_error"}}, status_code=500)
+        return None
+
+    def rate_limit_headers(self) -> Dict[str, str]:
+        return {
+            "x-ratelimit-limit-requests": str(self.args.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(self.args.requests_per_minute - 1),
+            "x-ratelimit-reset-requests": "20ms",
+            "x-ratelimit-limit-tokens": str(self.args.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(self.args.tokens_per_minute - 1000),
+            "x-ratelimit-reset-tokens": "1s",
+        }
+
+    def answer(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> List[str]:
+        """
+        Returns the completion as a list of tokens: issue ids for the find-issue prompts (so ChatClient parses
+        something realistic, with NONE for a --no-match-rate share of them), filler words otherwise.
+        """
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        conversations = BATCH_CONVERSATION_PATTERN.findall(prompt)
+        if conversations:
+            return [f"{number}: {self.issue_answer()}\n" for number in conversations]
+        if "issueID" in prompt:
+            return [self.issue_answer()]
+        count = min(self.args.completion_tokens, max_tokens or self.args.completion_tokens)
+        return [self.rng.choice(WORDS) + " " for _ in range(count)]
+
+    def issue_answer(self) -> str:
+        return "NONE" if self.rng.random() < self.args.no_match_rate else "1"
+
+    def usage(self, messages: List[Dict[str, Any]], completion_tokens: int) -> Dict[str, int]:
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    async def generation_delay(self, tokens: int) -> None:
+        await asyncio.sleep(self.latency.sample(self.rng) + tokens / self.args.tokens_per_second)
+
+    # Chat completions
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        choices = []
+        completion_tokens = 0
+        for index in range(body.get("n") or 1):
+            tokens = self.answer(body["messages"], body.get("max_tokens"))
+            completion_tokens += len(tokens)
+            choices.append({
+                "index": index,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            })
+        return {
+            "id": self.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+            "usage": self.usage(body["messages"], completion_tokens),
+        }
+
+    async def chat_completion(self, body: Dict[str, Any]) -> Response:
+        error = self.injected_error()
+        if error is not None:
+            return error
+
+        if body.get("stream"):
+            return StreamingResponse(self.chat_stream(body), media_type="text/event-stream", headers=self.rate_limit_headers())
+
+        completion = self.completion(body)
+        await self.generation_delay(completion["usage"]["completion_tokens"] // len(completion["choices"]))
+        return JSONResponse(completion, headers=self.rate_limit_headers())
+
+    async def chat_stream(self, body: Dict[str, Any]) -> AsyncIterator[str]:
+        completion_id = self.new_id("chatcmpl")
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        await asyncio.sleep(self.latency.sample(self.rng))
+        yield chunk({"role": "assistant", "content": ""})
+        for token in self.answer(body["messages"], body.get("max_tokens")):
+            await asyncio.sleep(1 / self.args.tokens_per_second)
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    # Assistants: threads, messages and runs
+
+    def message(self, thread_id: str, role: str, content: str) -> Dict[str, Any]:
+        message = {
+            "id": self.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "assistant_id": None,
+            "run_id": None,
+            "attachments": [],
+            "metadata": {},
+        }
+        self.threads[thread_id].append(message)
+        return message
+
+    def list_messages(self, thread_id: str, order: str, after: Optional[str], limit: int) -> Dict[str, Any]:
+        messages = list(self.threads.get(thread_id, []))
+        if order == "desc":
+            messages.reverse()
+        if after is not None:
+            ids = [message["id"] for message in messages]
+            messages = messages[ids.index(after) + 1:] if after in ids else []
+        page = messages[:limit]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(messages) > limit,
+        }
+
+    def create_run(self, thread_id: str, assistant_id: str) -> Dict[str, Any]:
+        run = {
+            "id": self.new_id("run"),
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": "queued",
+            "model": "mock",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "required_action": None,
+        }
+        latency = self.run_latency.sample(self.rng)
+        needs_tool = self.rng.random() < self.args.tool_call_rate
+        # With a tool call the run stops half way to wait for the output
+        self.runs[run["id"]] = {
+            "run": run,
+            "ready_at": time.monotonic() + (latency / 2 if needs_tool else latency),
+            "remaining": latency / 2 if needs_tool else 0.0,
+            "needs_tool": needs_tool,
+        }
+        return run
+
+    def advance(self, run_id: str) -> Dict[str, Any]:
+        state = self.runs[run_id]
+        run = state["run"]
+        if run["status"] in ("completed", "requires_action", "cancelled", "failed"):
+            return run
+        if time.monotonic() < state["ready_at"]:
+            run["status"] = "in_progress"
+            return run
+
+        if state["needs_tool"]:
+            state["needs_tool"] = False
+            run["status"] = "requires_action"
+            run["required_action"] = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": [{
+                    "id": self.new_id("call"),
+                    "type": "function",
+                    "function": {"name": "lookup_order", "arguments": json.dumps({"order_id": "1234"})},
+                }]},
+            }
+            return run
+
+        run["status"] = "completed"
+        reply = self.message(run["thread_id"], "assistant", "".join(self.answer([], None)).strip())
+        reply.update(assistant_id=run["assistant_id"], run_id=run["id"])
+        return run
+
+    def submit_tool_outputs(self, run_id: str) -> Dict[str, Any]:
+        state = self.runs[run_id]
+        state["run"].update(status="in_progress", required_action=None)
+        state["ready_at"] = time.monotonic() + state["remaining"]
+        return state["run"]
+
+    async def run_events(self, run_id: str) -> AsyncIterator[str]:
+        def event(name: str, data: Any) -> str:
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        run = self.runs[run_id]["run"]
+        yield event("thread.run.created" if run["status"] == "queued" else "thread.run.in_progress", run)
+        while True:
+            delay = self.runs[run_id]["ready_at"] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            run = self.advance(run_id)
+            if run["status"] in ("completed", "requires_action", "cancelled", "failed"):
+                yield event(f"thread.run.{run['status']}", run)
+                break
+        yield "event: done\ndata: [DONE]\n\n"
+
+    # Files and batches
+
+    def upload(self, content_type: str, body: bytes) -> Dict[str, Any]:
+        # Parse the multipart body with the standard library instead of requiring python-multipart
+        form = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        content, filename, purpose = b"", "upload.jsonl", "batch"
+        for part in form.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True) or b""
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = (part.get_payload(decode=True) or b"").decode()
+        file_id = self.new_id("file")
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        batch = {
+            "id": self.new_id("batch"),
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        self.batches[batch["id"]] = {"batch": batch, "ready_at": time.monotonic() + self.args.batch_latency}
+        return batch
+
+    def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        state = self.batches[batch_id]
+        batch = state["batch"]
+        if batch["status"] == "completed":
+            return batch
+        if time.monotonic() < state["ready_at"]:
+            batch["status"] = "in_progress"
+            return batch
+
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": self.new_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": self.new_id("req"), "body": self.completion(request["body"])},
+                "error": None,
+            }))
+        output_file_id = self.new_id("file")
+        self.files[output_file_id] = "\n".join(lines).encode()
+        batch.update(status="completed", output_file_id=output_file_id)
+        return batch
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    mock = MockOpenAI(args)
+    app = FastAPI(title="Mock OpenAI")
+    app.state.mock = mock
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await mock.chat_completion(await request.json())
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        thread_id = mock.new_id("thread")
+        mock.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        body = await request.json()
+        return mock.message(thread_id, body["role"], body["content"])
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str, order: str = "desc", after: str = None, limit: int = 20):
+        return mock.list_messages(thread_id, order, after, limit)
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        error = mock.injected_error()
+        if error is not None:
+            return error
+        body = await request.json()
+        run = mock.create_run(thread_id, body["assistant_id"])
+        if body.get("stream"):
+            return StreamingResponse(mock.run_events(run["id"]), media_type="text/event-stream")
+        return run
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        return mock.advance(run_id)
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str, request: Request):
+        body = await request.json()
+        run = mock.submit_tool_outputs(run_id)
+        if body.get("stream"):
+            return StreamingResponse(mock.run_events(run_id), media_type="text/event-stream")
+        return run
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        run = mock.runs[run_id]["run"]
+        run["status"] = "cancelled"
+        return run
+
+    @app.post("/v1/files")
+    async def upload_file(request: Request):
+        return mock.upload(request.headers.get("content-type", ""), await request.body())
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        return Response(mock.files[file_id], media_type="application/octet-stream")
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        return mock.create_batch(await request.json())
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        return mock.retrieve_batch(batch_id)
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {"requests": mock.requests, "threads": len(mock.threads), "runs": len(mock.runs), "batches": len(mock.batches)}
+
+    return app
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="lognormal:0.3,0.4", help="Time to first token of a completion")
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--completion-tokens", type=int, default=40)
+    parser.add_argument("--run-latency", default="lognormal:1.5,0.4", help="Time an assistant run takes to complete")
+    parser.add_argument("--tool-call-rate", type=float, default=0.0, help="Share of runs that ask for one tool call")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="Seconds until a batch completes")
+    parser.add_argument("--no-match-rate", type=float, default=0.2, help="Share of find-issue answers that match no issue")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failed with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After sent with injected 429s, in seconds")
+    parser.add_argument("--requests-per-minute", type=int, default=10000)
+    parser.add_argument("--tokens-per-minute", type=int, default=2000000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> None:
+    import uvicorn
+
+    args = parse_args(argv)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
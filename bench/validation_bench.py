@@ -0,0 +1,144 @@
+# validation_bench.py
+#
+# Microbenchmark of the per-request CPU spent validating and serialising the app's schemas:
+#
+#   python -m bench.validation_bench --issues 200 --messages 20 --iterations 2000
+#
+# Each case runs the old code path ("before") and the current one ("after") on the same payload and reports the
+# CPU time (time.process_time, best of --repeat rounds) per operation:
+#   find-issue request   full issue list in every body vs. an issue_catalog_id registered once
+#   batch request        the same for /chat/find-issue/batch
+#   assistant / file / deletion   SDK object -> model_dump() -> Model(**dict) vs. Model.model_validate(sdk_object)
+#   sse event / ws frame json.dumps vs. the json_codec encoder used by the streaming routes
+#   batch response       jsonable_encoder + json.dumps (a custom response class) vs. the pydantic-core
+#                        dump_json path FastAPI takes for routes with a response model
+# Only the schema work is measured: no server, sockets or upstream calls are involved.
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from openai.types.beta import Assistant as SDKAssistant
+from openai.types.beta.assistant_deleted import AssistantDeleted
+from pydantic import BaseModel, TypeAdapter
+
+from app.models.schemas import Assistant, DeletionResponse, FileObject, FindIssueBatchRequest, FindIssueBatchResponse, FindIssueRequest, FindIssueResponse
+from app.services.issue_catalog import ISSUE_LIST_ADAPTER, IssueCatalog
+from app.services.json_codec import dumps
+
+Case = Tuple[str, Callable[[], Any], Callable[[], Any]]
+
+
+class SDKFile(BaseModel):
+    # Stands in for the SDK's assistant file object, which newer openai releases no longer ship
+    id: str
+    object: str
+    created_at: int
+    assistant_id: str
+
+
+def make_issues(count: int) -> List[Dict[str, str]]:
+    return [
+        {
+            "issue_id": f"ISSUE-{index}",
+            "issue_name": f"Issue number {index}",
+            "issue_description": f"Customers report that feature {index} does not work as expected after the last update. " * 3,
+        }
+        for index in range(count)
+    ]
+
+
+def make_conversation(messages: int) -> Dict[str, Any]:
+    return {"messages": [
+        {"role": "user" if index % 2 == 0 else "system", "content": f"Message {index}: my order has not been picked up yet and nobody answers the phone."}
+        for index in range(messages)
+    ]}
+
+
+def make_cases(args: argparse.Namespace) -> List[Case]:
+    issues = make_issues(args.issues)
+    conversation = make_conversation(args.messages)
+    conversations = [conversation] * args.batch_size
+
+    catalog = IssueCatalog()
+    catalog_id = catalog.register(ISSUE_LIST_ADAPTER.validate_python(issues))
+
+    inline_body = json.dumps({"conversation": conversation, "issues": issues})
+    catalog_body = json.dumps({"conversation": conversation, "issue_catalog_id": catalog_id})
+    inline_batch_body = json.dumps({"conversations": conversations, "issues": issues})
+    catalog_batch_body = json.dumps({"conversations": conversations, "issue_catalog_id": catalog_id})
+
+    def parse_catalog_request(body: str, model: type) -> Any:
+        request = model.model_validate_json(body)
+        return request, catalog.get(request.issue_catalog_id)
+
+    sdk_assistant = SDKAssistant.model_validate({
+        "id": "asst_bench", "object": "assistant", "created_at": 1700000000, "name": "Bench", "description": None,
+        "model": "gpt-3.5-turbo", "instructions": "You are a helpful assistant. " * 20,
+        "tools": [{"type": "code_interpreter"}, {"type": "function", "function": {"name": "lookup_order", "parameters": {"type": "object", "properties": {"order_id": {"type": "string"}}}}}],
+        "metadata": {"team": "support", "tier": "gold"}, "file_ids": [f"file_{index}" for index in range(10)],
+    })
+    sdk_file = SDKFile(id="file_bench", object="assistant.file", created_at=1700000000, assistant_id="asst_bench")
+    sdk_deleted = AssistantDeleted(id="asst_bench", object="assistant.deleted", deleted=True)
+
+    token_event = {"delta": "Hello"}
+    ws_frame = {"request_id": "r-1", "type": "delta", "content": "Hello"}
+
+    batch_response = FindIssueBatchResponse(results=[FindIssueResponse(found_issue=True, issue_id="ISSUE-1")] * args.batch_size)
+    batch_response_adapter = TypeAdapter(FindIssueBatchResponse)
+
+    return [
+        ("find-issue request", lambda: FindIssueRequest.model_validate_json(inline_body), lambda: parse_catalog_request(catalog_body, FindIssueRequest)),
+        ("batch request", lambda: FindIssueBatchRequest.model_validate_json(inline_batch_body), lambda: parse_catalog_request(catalog_batch_body, FindIssueBatchRequest)),
+        ("assistant", lambda: Assistant(**sdk_assistant.model_dump()), lambda: Assistant.model_validate(sdk_assistant)),
+        ("file", lambda: FileObject(**sdk_file.model_dump()), lambda: FileObject.model_validate(sdk_file)),
+        ("deletion", lambda: DeletionResponse(**sdk_deleted.model_dump()), lambda: DeletionResponse.model_validate(sdk_deleted)),
+        ("sse event", lambda: json.dumps(token_event), lambda: dumps(token_event)),
+        ("ws frame", lambda: json.dumps(ws_frame), lambda: dumps(ws_frame)),
+        ("batch response", lambda: json.dumps(jsonable_encoder(batch_response)).encode("utf-8"), lambda: batch_response_adapter.dump_json(batch_response)),
+    ]
+
+
+def cpu_per_call(function: Callable[[], Any], iterations: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.process_time()
+        for _ in range(iterations):
+            function()
+        best = min(best, (time.process_time() - started_at) / iterations)
+    return best
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CPU per request spent on schema validation and serialisation")
+    parser.add_argument("--issues", type=int, default=100, help="Issues in the catalogue")
+    parser.add_argument("--messages", type=int, default=10, help="Messages per conversation")
+    parser.add_argument("--batch-size", type=int, default=10, help="Conversations per batch request")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    results = []
+    print(f"{'case':<20} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, before, after in make_cases(args):
+        before_seconds = cpu_per_call(before, args.iterations, args.repeat)
+        after_seconds = cpu_per_call(after, args.iterations, args.repeat)
+        speedup = before_seconds / after_seconds if after_seconds else float("inf")
+        results.append({"case": name, "before_us": before_seconds * 1e6, "after_us": after_seconds * 1e6, "speedup": speedup})
+        print(f"{name:<20} {before_seconds * 1e6:>10.1f} {after_seconds * 1e6:>10.1f} {speedup:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Encoded hashes use the PHC string format, e.g.
+#   $pbkdf2-sha256$i=600000$<salt>$<hash>
+#   $scrypt$ln=14,r=8,p=1$<salt>$<hash>
+# with salt and hash in unpadded base64, so a stored hash carries everything needed to verify it.
+PBKDF2_ITERATIONS = 600000
+PBKDF2_MAX_ITERATIONS = 2 ** 31 - 1  # hashlib.pbkdf2_hmac raises OverflowError above this
+SCRYPT_LOG_N = 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+HASH_SIZE = 32
+ALGORITHMS = ('pbkdf2-sha256', 'scrypt')
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def default_params(algorithm):
+    if algorithm == 'pbkdf2-sha256':
+        return {'i': PBKDF2_ITERATIONS}
+    if algorithm == 'scrypt':
+        return {'ln': SCRYPT_LOG_N, 'r': SCRYPT_R, 'p': SCRYPT_P}
+    raise ValueError(f'Unsupported algorithm: {algorithm}')
+
+
+def derive(password, algorithm, params, salt, length=HASH_SIZE):
+    """
+    Runs the key derivation function on one password.
+
+    :param password: The password as str or bytes
+    :param algorithm: 'pbkdf2-sha256' or 'scrypt'
+    :param params: Work factor, {'i': iterations} or {'ln': log2(N), 'r': r, 'p': p}
+    :param salt: Salt bytes
+    :param length: Length of the derived hash in bytes
+    :return: The derived hash as bytes
+    """
+    if isinstance(password, str):
+        password = password.encode('utf-8')
+    if algorithm == 'pbkdf2-sha256':
+        return hashlib.pbkdf2_hmac('sha256', password, salt, params['i'], length)
+    if algorithm == 'scrypt':
+        n = 1 << params['ln']
+        # scrypt needs about 128 * r * N bytes; leave room above OpenSSL's 32 MiB default
+        return hashlib.scrypt(password, salt=salt, n=n, r=params['r'], p=params['p'], maxmem=256 * params['r'] * n + (1 << 20), dklen=length)
+    raise ValueError(f'Unsupported algorithm: {algorithm}')
+
+
+def encode_hash(algorithm, params, salt, digest):
+    encoded_params = ','.join(f'{name}={value}' for name, value in params.items())
+    return f'${algorithm}${encoded_params}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def decode_hash(encoded):
+    """
+    Splits an encoded hash into its parts, checking that they can be passed to derive.
+
+    :param encoded: A hash produced by hash_password_kdf
+    :return: (algorithm, params, salt bytes, hash bytes)
+    :raises ValueError: If encoded is not a well-formed hash for a supported algorithm
+    """
+    try:
+        _, algorithm, encoded_params, salt, digest = encoded.split('$')
+        params = {name: int(value) for name, value in (item.split('=') for item in encoded_params.split(','))}
+        salt, digest = _b64decode(salt), _b64decode(digest)
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f'Not an encoded password hash: {encoded!r}')
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'Unsupported algorithm: {algorithm}')
+    if params.keys() != default_params(algorithm).keys() or any(value < 1 for value in params.values()):
+        raise ValueError(f'Invalid parameters for {algorithm}: {encoded_params}')
+    # 1 << ln must stay a sensible scrypt cost (OpenSSL rejects anything larger anyway)
+    if algorithm == 'scrypt' and params['ln'] > 31:
+        raise ValueError(f'Invalid parameters for {algorithm}: {encoded_params}')
+    if algorithm == 'pbkdf2-sha256' and params['i'] > PBKDF2_MAX_ITERATIONS:
+        raise ValueError(f'Invalid parameters for {algorithm}: {encoded_params}')
+    if not digest:
+        raise ValueError(f'Encoded password hash has an empty digest: {encoded!r}')
+    return algorithm, params, salt, digest
+
+
+def hash_password_kdf(password, algorithm='pbkdf2-sha256', params=None, salt=None):
+    """
+    Hashes one password with a salted, work-factor KDF and returns the encoded hash.
+
+    :param password: The password to hash
+    :param algorithm: 'pbkdf2-sha256' or 'scrypt'
+    :param params: Work factor (defaults to default_params(algorithm))
+    :param salt: Salt bytes (a random salt per password by default)
+    :return: The encoded hash string
+    """
+    params = params or default_params(algorithm)
+    salt = salt if salt is not None else os.urandom(SALT_SIZE)
+    return encode_hash(algorithm, params, salt, derive(password, algorithm, params, salt))
+
+
+def _hash_chunk(passwords, algorithm, params):
+    # Runs in a worker process; a whole chunk per task keeps the pickling overhead small
+    return [hash_password_kdf(password, algorithm, params) for password in passwords]
+
+
+class BatchHasher:
+    """
+    Hashes streams of passwords across a process pool so every core is busy (the KDFs are CPU bound and
+    would serialize on the GIL in threads). Passwords are sent to the workers in chunks and at most a few
+    chunks per worker are in flight, so arbitrarily large inputs are hashed in constant memory; results
+    come back in input order. 'hashed', 'seconds' and 'hashes_per_second' report the throughput.
+    """
+
+    def __init__(self, algorithm='pbkdf2-sha256', params=None, workers=None, chunksize=16):
+        self.algorithm = algorithm
+        self.params = params or default_params(algorithm)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.hashed = 0
+        self.seconds = 0.0
+
+    @property
+    def hashes_per_second(self):
+        return self.hashed / self.seconds if self.seconds else 0.0
+
+    def map_chunks(self, function, items, *args):
+        """
+        Applies function(chunk, *args) to consecutive chunks of items in the pool and yields the results
+        item by item, in order.
+        """
+        started_at = time.perf_counter()
+        items = iter(items)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                pending = deque()
+                while True:
+                    chunk = list(itertools.islice(items, self.chunksize))
+                    if chunk:
+                        pending.append(pool.submit(function, chunk, *args))
+                    if pending and (not chunk or len(pending) >= self.workers * 2):
+                        for result in pending.popleft().result():
+                            self.hashed += 1
+                            yield result
+                    if not chunk and not pending:
+                        break
+        finally:
+            self.seconds += time.perf_counter() - started_at
+
+    def hash_many(self, passwords):
+        """
+        :param passwords: Iterable of passwords (str or bytes), e.g. a file object
+        :return: A generator of encoded hashes, one per password, in input order
+        """
+        return self.map_chunks(_hash_chunk, passwords, self.algorithm, self.params)
+
+
+def time_one(algorithm, params, samples=3):
+    salt = os.urandom(SALT_SIZE)
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        derive('calibration password', algorithm, params, salt)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def calibrate(target_seconds=0.25, algorithm='pbkdf2-sha256'):
+    """
+    Finds the work factor that makes one hash take about target_seconds on this machine.
+
+    :param target_seconds: Wanted time per hash on one core
+    :param algorithm: 'pbkdf2-sha256' or 'scrypt'
+    :return: (params, measured seconds per hash)
+    """
+    if algorithm == 'pbkdf2-sha256':
+        # PBKDF2 time is linear in the iteration count, so measure a small count and scale it up
+        probe = {'i': 10000}
+        iterations = max(1000, int(probe['i'] * target_seconds / time_one(algorithm, probe)))
+        params = {'i': iterations}
+        return params, time_one(algorithm, params)
+
+    # scrypt's N must be a power of two: double it until one hash reaches the target
+    params = {'ln': 10, 'r': SCRYPT_R, 'p': SCRYPT_P}
+    seconds = time_one(algorithm, params)
+    while seconds < target_seconds and params['ln'] < 20:
+        params = {**params, 'ln': params['ln'] + 1}
+        seconds = time_one(algorithm, params)
+    return params, seconds
+
+
+def benchmark(algorithm='pbkdf2-sha256', target_seconds=0.25, count=None, workers=None):
+    """
+    Calibrates the work factor for the target latency, then measures batch throughput with it.
+    """
+    params, seconds = calibrate(target_seconds, algorithm)
+    hasher = BatchHasher(algorithm, params, workers=workers, chunksize=1)
+    count = count or hasher.workers * 4
+    for _ in hasher.hash_many(f'password-{index}' for index in range(count)):
+        pass
+    return params, seconds, hasher.hashes_per_second
+
+
+if __name__ == '__main__':
+    # Example usage:
+    #   python batch_hash.py hash [pbkdf2-sha256|scrypt] < passwords.txt > hashes.txt
+    #   python batch_hash.py bench [pbkdf2-sha256|scrypt] [target ms per hash]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    algorithm = sys.argv[2] if len(sys.argv) > 2 else 'pbkdf2-sha256'
+
+    if command == 'hash':
+        hasher = BatchHasher(algorithm)
+        for encoded in hasher.hash_many(line.rstrip('\n') for line in sys.stdin):
+            print(encoded)
+        print(f'{hasher.hashed} hashes in {hasher.seconds:.1f}s ({hasher.hashes_per_second:.1f} hashes/sec)', file=sys.stderr)
+    else:
+        target_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 250
+        params, seconds, rate = benchmark(algorithm, target_ms / 1000)
+        print(f'{algorithm} {params}: {seconds * 1000:.0f} ms per hash, {rate:.1f} hashes/sec on {os.cpu_count()} cores')
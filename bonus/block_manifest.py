@@ -0,0 +1,163 @@
+import os
+import struct
+import sys
+from collections import namedtuple
+
+from individual_hashes import DEFAULT_BLOCK_SIZE, digest_size, iter_block_digests
+
+# Manifest layout: a fixed header followed by the raw block digests, back to back, in block order.
+# Header: magic, format version, digest size, algorithm name (NUL padded), block size, file size, file mtime (ns)
+MANIFEST_MAGIC = b'BLKM'
+MANIFEST_VERSION = 1
+HEADER = struct.Struct('<4sBB16sIQq')
+
+Manifest = namedtuple('Manifest', ['algorithm', 'digest_size', 'block_size', 'file_size', 'mtime_ns', 'digests'])
+BlockDiff = namedtuple('BlockDiff', ['changed', 'removed', 'block_count', 'rehashed'])
+
+
+def block_count(file_size, block_size):
+    return (file_size + block_size - 1) // block_size
+
+
+def manifest_is_complete(manifest):
+    return len(manifest.digests) == block_count(manifest.file_size, manifest.block_size) * manifest.digest_size
+
+
+def read_manifest(manifest_path):
+    """
+    Reads a block digest manifest. A manifest that was interrupted while being written is returned with the
+    digests it has so far (see manifest_is_complete); a trailing partial digest is dropped.
+
+    :param manifest_path: Path to the manifest file
+    :return: A Manifest tuple; 'digests' holds the raw digests packed into one bytes object
+    """
+    with open(manifest_path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f'{manifest_path} is not a block manifest (truncated header)')
+        magic, version, digest_size, algorithm, block_size, file_size, mtime_ns = HEADER.unpack(header)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            raise ValueError(f'{manifest_path} is not a version {MANIFEST_VERSION} block manifest')
+        digests = f.read()
+    digests = digests[:len(digests) - len(digests) % digest_size]
+    return Manifest(algorithm.rstrip(b'\0').decode('ascii'), digest_size, block_size, file_size, mtime_ns, digests)
+
+
+def _file_matches(manifest, stat, block_size, algorithm):
+    # Cheap check: same size and modification time as when the manifest was written, hashed the same way
+    return (
+        manifest.file_size == stat.st_size
+        and manifest.mtime_ns == stat.st_mtime_ns
+        and manifest.block_size == block_size
+        and manifest.algorithm == algorithm
+    )
+
+
+def write_manifest(file_path, manifest_path, block_size=DEFAULT_BLOCK_SIZE, algorithm='sha256', workers=None):
+    """
+    Hashes a file block by block into a manifest. If the manifest already exists for the same file size, mtime,
+    block size and algorithm, an interrupted run is resumed from the last digest written and a complete
+    manifest is returned as is; otherwise the file is hashed from scratch.
+
+    :param file_path: Path to the file to be hashed
+    :param manifest_path: Path of the manifest to write
+    :param block_size: Size of each block (in bytes)
+    :param algorithm: Any hashlib algorithm name with a fixed-size digest
+    :param workers: Number of hashing threads (defaults to the number of CPUs)
+    :return: The finished Manifest
+    """
+    # Reject what the header cannot hold before anything is written
+    size = digest_size(algorithm)
+    if not 0 < block_size < 2 ** 32:
+        raise ValueError(f'Block size must be between 1 and {2 ** 32 - 1} bytes, got {block_size}')
+    stat = os.stat(file_path)
+    start_block = 0
+    if os.path.exists(manifest_path):
+        try:
+            existing = read_manifest(manifest_path)
+        except ValueError:
+            existing = None
+        if existing is not None and _file_matches(existing, stat, block_size, algorithm):
+            if manifest_is_complete(existing):
+                return existing
+            start_block = len(existing.digests) // existing.digest_size
+
+    if start_block:
+        f = open(manifest_path, 'r+b')
+        # Drop a digest that was only partly written when the previous run stopped
+        f.truncate(HEADER.size + start_block * existing.digest_size)
+        f.seek(0, os.SEEK_END)
+    else:
+        f = open(manifest_path, 'wb')
+        f.write(HEADER.pack(
+            MANIFEST_MAGIC, MANIFEST_VERSION, size, algorithm.encode('ascii'),
+            block_size, stat.st_size, stat.st_mtime_ns
+        ))
+
+    with f:
+        for _, digest in iter_block_digests(file_path, block_size, algorithm, workers, start_block=start_block):
+            f.write(digest)
+
+    return read_manifest(manifest_path)
+
+
+def diff_blocks(file_path, manifest_path, block_size=None, algorithm=None, workers=None, trust_mtime=True):
+    """
+    Compares a file against a previously written manifest and returns only the blocks that changed; the manifest
+    is then updated to describe the file as it is now.
+
+    When the file's size and mtime still match the manifest (and trust_mtime is set), nothing is re-hashed.
+    Otherwise the file is hashed into '<manifest>.partial', which resumes on the next call if it is interrupted,
+    and swapped in atomically once complete.
+
+    :param file_path: Path to the file to check
+    :param manifest_path: Path to the manifest from the previous run
+    :param block_size: Block size (defaults to the manifest's)
+    :param algorithm: Hash algorithm (defaults to the manifest's)
+    :param workers: Number of hashing threads (defaults to the number of CPUs)
+    :param trust_mtime: Skip re-hashing when size and mtime are unchanged
+    :return: BlockDiff(changed block indices, removed block indices, current block count, whether the file was re-hashed)
+    """
+    old = read_manifest(manifest_path) if os.path.exists(manifest_path) else None
+    block_size = block_size or (old.block_size if old else DEFAULT_BLOCK_SIZE)
+    algorithm = algorithm or (old.algorithm if old else 'sha256')
+    stat = os.stat(file_path)
+
+    if old is not None and trust_mtime and manifest_is_complete(old) and _file_matches(old, stat, block_size, algorithm):
+        return BlockDiff([], [], block_count(old.file_size, old.block_size), False)
+
+    partial_path = manifest_path + '.partial'
+    new = write_manifest(file_path, partial_path, block_size, algorithm, workers)
+    new_count = len(new.digests) // new.digest_size
+
+    # Digests are only comparable when the blocks line up and were hashed the same way
+    if old is None or old.block_size != block_size or old.algorithm != algorithm:
+        changed, removed = list(range(new_count)), []
+    else:
+        size = new.digest_size
+        old_count = len(old.digests) // size
+        old_view, new_view = memoryview(old.digests), memoryview(new.digests)
+        changed = [
+            index for index in range(new_count)
+            if index >= old_count or old_view[index * size:(index + 1) * size] != new_view[index * size:(index + 1) * size]
+        ]
+        removed = list(range(new_count, old_count))
+
+    os.replace(partial_path, manifest_path)
+    return BlockDiff(changed, removed, new_count, True)
+
+
+if __name__ == '__main__':
+    # Example usage:
+    #   python block_manifest.py hash path_to_your_file path_to_manifest
+    #   python block_manifest.py diff path_to_your_file path_to_manifest
+    command, file_path, manifest_path = sys.argv[1:4]
+    if command == 'hash':
+        manifest = write_manifest(file_path, manifest_path)
+        print(f'Hashed {len(manifest.digests) // manifest.digest_size} blocks into {manifest_path}')
+    else:
+        diff = diff_blocks(file_path, manifest_path)
+        if not diff.rehashed:
+            print('Unchanged (same size and mtime)')
+        print(f'Changed blocks: {diff.changed}')
+        print(f'Removed blocks: {diff.removed}')
@@ -12,7 +12,8 @@ def hash_password(password):
     
     return hex_dig
 
-# Example usage
-password = 'example_password'
-hashed_password = hash_password(password)
-print('Hashed Password:', hashed_password)
+if __name__ == '__main__':
+    # Example usage
+    password = 'example_password'
+    hashed_password = hash_password(password)
+    print('Hashed Password:', hashed_password)
@@ -1,13 +1,87 @@
+import hashlib
 import hmac
 
+from batch_hash import BatchHasher, decode_hash, derive
+
+
 def compare_hashed_strings(hash1, hash2):
-    # Securely compare two hashed strings
-    return hash1 == hash2
+    # Securely compare two hashed strings: the time taken does not depend on where they first differ
+    return hmac.compare_digest(hash1.encode('utf-8'), hash2.encode('utf-8'))
+
+
+def compare_digests(digest1, digest2):
+    """
+    Constant-time comparison of two raw digests.
+
+    :param digest1: Digest bytes
+    :param digest2: Digest bytes
+    :return: True if they are equal
+    """
+    return hmac.compare_digest(digest1, digest2)
+
+
+def verify_many(pairs, algorithm='sha256'):
+    """
+    Checks many (candidate, stored hex hash) pairs in one call, where the stored hash is a plain digest of the
+    candidate (as produced by hash.py). Each stored hash is decoded from hex once and compared as raw digest
+    bytes, in constant time.
+
+    :param pairs: Iterable of (candidate string, stored hexadecimal hash)
+    :param algorithm: hashlib algorithm the stored hashes were made with
+    :return: A list of booleans, one per pair
+    """
+    results = []
+    for candidate, stored in pairs:
+        try:
+            expected = bytes.fromhex(stored)
+        except (TypeError, ValueError):
+            results.append(False)  # Not a hex digest, so it cannot match
+            continue
+        results.append(hmac.compare_digest(hashlib.new(algorithm, candidate.encode('utf-8')).digest(), expected))
+    return results
+
+
+def verify_password(password, encoded):
+    """
+    Checks a password against an encoded KDF hash from batch_hash.py, in constant time.
+
+    :param password: The candidate password
+    :param encoded: The stored encoded hash
+    :return: True if the password matches, False if it does not or the stored hash cannot be decoded
+    """
+    try:
+        algorithm, params, salt, expected = decode_hash(encoded)
+        # derive raises ValueError or OverflowError for work factors the KDF itself rejects, e.g. a scrypt r * p
+        # that is too large
+        derived = derive(password, algorithm, params, salt, len(expected))
+    except (ValueError, OverflowError):
+        return False
+    return hmac.compare_digest(derived, expected)
+
+
+def _verify_chunk(pairs):
+    # Runs in a worker process
+    return [verify_password(password, encoded) for password, encoded in pairs]
+
+
+def verify_passwords(pairs, workers=None, chunksize=16):
+    """
+    Verifies many (password, encoded hash) pairs, e.g. a batch of logins, across a process pool so the KDF work
+    uses every core. Pairs are streamed through the pool in chunks, so large inputs use constant memory.
+
+    :param pairs: Iterable of (password, encoded hash)
+    :param workers: Number of worker processes (defaults to the number of CPUs)
+    :param chunksize: Pairs per task sent to a worker
+    :return: A generator of booleans, one per pair, in input order
+    """
+    return BatchHasher(workers=workers, chunksize=chunksize).map_chunks(_verify_chunk, pairs)
+
 
-# Example usage
-hash1 = 'a5f5d5f0e3943b2316584c3e5e9e3b5e'
-hash2 = 'a5f5d5f0e3943b2316584c3e5e9e3b5e'
-hash3 = 'b5e4d5e5f3942a1236584c3d4d9d2c5d'
+if __name__ == '__main__':
+    # Example usage
+    hash1 = 'a5f5d5f0e3943b2316584c3e5e9e3b5e'
+    hash2 = 'a5f5d5f0e3943b2316584c3e5e9e3b5e'
+    hash3 = 'b5e4d5e5f3942a1236584c3d4d9d2c5d'
 
-print('Hash 1 and Hash 2 are equal:', compare_hashed_strings(hash1, hash2))
-print('Hash 1 and Hash 3 are equal:', compare_hashed_strings(hash1, hash3))
+    print('Hash 1 and Hash 2 are equal:', compare_hashed_strings(hash1, hash2))
+    print('Hash 1 and Hash 3 are equal:', compare_hashed_strings(hash1, hash3))
@@ -1,6 +1,112 @@
 import hashlib
+import mmap
+import os
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def hash_blocks_individually(file_path, block_size=65536):
+DEFAULT_BLOCK_SIZE = 65536
+
+
+def digest_size(algorithm):
+    """
+    Checks that algorithm is a hashlib algorithm with a fixed-size digest and returns that size.
+
+    :param algorithm: Any hashlib algorithm name except the variable-length SHAKE functions
+    :return: The digest size in bytes
+    """
+    try:
+        return len(hashlib.new(algorithm).digest())
+    except TypeError:
+        raise ValueError(f'{algorithm} has a variable-length digest, which block hashes cannot use')
+
+
+def _hash_block(algorithm, view, offset, block_size):
+    # hashlib releases the GIL while hashing buffers larger than 2 KiB, so blocks really hash in parallel.
+    # The slice is never bound to a name, so it is released even when hashing fails and the traceback is kept
+    return hashlib.new(algorithm, view[offset:offset + block_size]).digest()
+
+
+def _result(future):
+    try:
+        return future.result()
+    except BaseException as e:
+        # The failed frames may still reference blocks of the map; drop them so it can be closed and this error
+        # is the one the caller sees
+        traceback.clear_frames(e.__traceback__)
+        raise
+
+
+def iter_block_digests(file_path, block_size=DEFAULT_BLOCK_SIZE, algorithm='sha256', workers=None, start_block=0):
+    """
+    Hashes each block of a file and yields (index, digest) pairs in block order, as raw digest bytes.
+
+    The file is memory-mapped and blocks are handed to the hash function as memoryview slices, so no block is
+    copied. Blocks are hashed on a thread pool; only a small window of blocks is in flight at any time, so
+    memory use does not grow with the file size.
+
+    :param file_path: Path to the file to be hashed
+    :param block_size: Size of each block (in bytes)
+    :param algorithm: Any hashlib algorithm name with a fixed-size digest (not SHAKE)
+    :param workers: Number of hashing threads (defaults to the number of CPUs)
+    :param start_block: Index of the first block to hash, to skip blocks that were hashed before
+    :return: A generator of (block index, digest bytes) tuples
+    """
+    digest_size(algorithm)  # Fail on an unusable algorithm before the file is mapped
+    workers = workers or os.cpu_count() or 1
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start_block * block_size:
+            return  # Nothing to hash (an empty file cannot be memory-mapped)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            pending = deque()
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    try:
+                        for index, offset in enumerate(range(start_block * block_size, size, block_size), start=start_block):
+                            pending.append((index, pool.submit(_hash_block, algorithm, view, offset, block_size)))
+                            # Keep a few blocks per worker in flight and hand out results in order
+                            if len(pending) >= workers * 4:
+                                done_index, future = pending.popleft()
+                                yield done_index, _result(future)
+                        while pending:
+                            done_index, future = pending.popleft()
+                            yield done_index, _result(future)
+                    finally:
+                        # On an error (or when the caller stops early) skip the blocks that have not started
+                        for _, future in pending:
+                            future.cancel()
+            finally:
+                # Other blocks that failed meanwhile hold their tracebacks too; the pool has finished with them here
+                for _, future in pending:
+                    if not future.cancelled() and future.exception() is not None:
+                        traceback.clear_frames(future.exception().__traceback__)
+                # The view must be released before the map can be closed
+                view.release()
+
+
+def hash_blocks_compact(file_path, block_size=DEFAULT_BLOCK_SIZE, algorithm='sha256', workers=None):
+    """
+    Hashes each block of a file and returns all digests packed into one bytearray: block i's digest is
+    digests[i * digest_size:(i + 1) * digest_size]. A 32-byte digest per block instead of a 64-character
+    hex string object keeps the result small for multi-GB files.
+
+    :param file_path: Path to the file to be hashed
+    :param block_size: Size of each block (in bytes)
+    :param algorithm: Any hashlib algorithm name
+    :param workers: Number of hashing threads (defaults to the number of CPUs)
+    :return: A bytearray of concatenated raw digests
+    """
+    digests = bytearray()
+    for _, digest in iter_block_digests(file_path, block_size, algorithm, workers):
+        digests += digest
+    return digests
+
+
+def hash_blocks_individually(file_path, block_size=DEFAULT_BLOCK_SIZE):
     """
     Hashes each block of a file individually and returns a list of hash outputs for each block.
 
@@ -8,19 +114,73 @@ def hash_blocks_individually(file_path, block_size=65536):
     :param block_size: Size of each block read from the file (in bytes)
     :return: A list of hexadecimal hash strings, one for each block of the file content
     """
-    block_hashes = []
-    with open(file_path, 'rb') as f:  # Open the file in binary mode
-        block = f.read(block_size)  # Read the first block of the file
-        while block:  # Keep reading blocks until the end of the file
-            hash_object = hashlib.sha256()  # Create a new sha256 hash object for each block
-            hash_object.update(block)  # Update the hash object with the block
-            block_hashes.append(hash_object.hexdigest())  # Append the block's hash to the list
-            block = f.read(block_size)  # Read the next block of the file
-    return block_hashes
-
-# Example usage
-# Make sure to replace 'path_to_your_file' with the actual file path
-file_path = 'path_to_your_file'
-block_hashes = hash_blocks_individually(file_path)
-for i, block_hash in enumerate(block_hashes):
-    print(f'Block {i+1} hash: {block_hash}')
+    return [digest.hex() for _, digest in iter_block_digests(file_path, block_size)]
+
+
+class MerkleBuilder:
+    """
+    Builds a Merkle root over block digests as they arrive, keeping only one pending node per tree level
+    (O(log n) memory). Inner nodes are hash(0x01 || left || right); a node without a sibling is promoted to
+    the next level unchanged, so the root is the same as building the tree level by level.
+    """
+
+    def __init__(self, algorithm='sha256'):
+        self.algorithm = algorithm
+        self.leaves = 0
+        self._levels = []
+
+    def _combine(self, left, right):
+        return hashlib.new(self.algorithm, b'\x01' + left + right).digest()
+
+    def add(self, digest):
+        node = digest
+        height = 0
+        # Like incrementing a binary counter: complete subtrees merge upwards
+        while height < len(self._levels) and self._levels[height] is not None:
+            node = self._combine(self._levels[height], node)
+            self._levels[height] = None
+            height += 1
+        if height == len(self._levels):
+            self._levels.append(node)
+        else:
+            self._levels[height] = node
+        self.leaves += 1
+
+    def root(self):
+        node = None
+        for pending in self._levels:
+            if pending is not None:
+                node = pending if node is None else self._combine(pending, node)
+        # The root of no blocks is the hash of nothing
+        return node if node is not None else hashlib.new(self.algorithm).digest()
+
+
+def merkle_root(digests, algorithm='sha256'):
+    """
+    Computes the Merkle root of a sequence of block digests.
+
+    :param digests: Iterable of raw digest bytes, in block order
+    :param algorithm: Hash algorithm used for the inner nodes
+    :return: The root digest as bytes
+    """
+    builder = MerkleBuilder(algorithm)
+    for digest in digests:
+        builder.add(digest)
+    return builder.root()
+
+
+def file_merkle_root(file_path, block_size=DEFAULT_BLOCK_SIZE, algorithm='sha256', workers=None):
+    """
+    Hashes a file block by block and returns its Merkle root without keeping the block digests around.
+    """
+    return merkle_root((digest for _, digest in iter_block_digests(file_path, block_size, algorithm, workers)), algorithm)
+
+
+if __name__ == '__main__':
+    # Example usage: python individual_hashes.py path_to_your_file
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'path_to_your_file'
+    builder = MerkleBuilder()
+    for i, block_hash in iter_block_digests(file_path):
+        builder.add(block_hash)
+        print(f'Block {i+1} hash: {block_hash.hex()}')
+    print(f'Merkle root: {builder.root().hex()}')
@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app is started from app/ (uvicorn main:app) and the bonus scripts import each other by module name
+for path in (ROOT, os.path.join(ROOT, "app"), os.path.join(ROOT, "bonus")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Read at import time by the services, so they have to be set before anything imports them
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("OPENAI_WARMUP", "0")
+os.environ.setdefault("OPENAI_CACHE_ENABLED", "0")
+
+import httpx
+import openai
+import pytest
+
+
+class MockUpstream:
+    """
+    Stands in for the OpenAI API: chat completions answer with 'answer' (or stream 'stream_tokens') and every
+    request body is kept in 'requests'.
+    """
+
+    def __init__(self):
+        self.answer = "NONE"
+        self.stream_tokens = ["he", "llo"]
+        self.requests = []
+
+    def _chunk(self, token: str) -> str:
+        chunk = {
+            "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "test",
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b"{}")
+        self.requests.append(body)
+        if body.get("stream"):
+            content = "".join(self._chunk(token) for token in self.stream_tokens) + "data: [DONE]\n\n"
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=content)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test",
+            "choices": [
+                {"index": index, "message": {"role": "assistant", "content": self.answer}, "finish_reason": "stop"}
+                for index in range(body.get("n", 1))
+            ],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+        })
+
+
+@pytest.fixture
+def upstream():
+    return MockUpstream()
+
+
+@pytest.fixture
+def client(upstream, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import app.services.openai_client as openai_client
+    from app.main import app
+
+    mock_openai = openai.AsyncOpenAI(
+        api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler)), max_retries=0
+    )
+    monkeypatch.setattr(openai_client, "_async_openai", mock_openai)
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,98 @@
+import hashlib
+import os
+
+import pytest
+
+import block_manifest
+from block_manifest import HEADER, diff_blocks, manifest_is_complete, read_manifest, write_manifest
+
+BLOCK = 1024
+
+
+def block_digests(data):
+    return b"".join(hashlib.sha256(data[offset:offset + BLOCK]).digest() for offset in range(0, len(data), BLOCK))
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(os.urandom(BLOCK * 10 + 100))
+    return path
+
+
+def test_write_and_read(data_file, tmp_path):
+    manifest_path = str(tmp_path / "data.manifest")
+    manifest = write_manifest(str(data_file), manifest_path, BLOCK)
+    assert manifest_is_complete(manifest)
+    assert manifest.digests == block_digests(data_file.read_bytes())
+    assert read_manifest(manifest_path) == manifest
+
+
+def test_interrupted_manifest_resumes(data_file, tmp_path, monkeypatch):
+    manifest_path = str(tmp_path / "data.manifest")
+    complete = write_manifest(str(data_file), manifest_path, BLOCK)
+
+    # Cut the manifest off after four digests and half of the fifth, as if the previous run was killed
+    with open(manifest_path, "r+b") as f:
+        f.truncate(HEADER.size + 4 * 32 + 16)
+    partial = read_manifest(manifest_path)
+    assert len(partial.digests) == 4 * 32 and not manifest_is_complete(partial)
+
+    started_at = []
+    iter_block_digests = block_manifest.iter_block_digests
+
+    def spy(*args, start_block=0, **kwargs):
+        started_at.append(start_block)
+        return iter_block_digests(*args, start_block=start_block, **kwargs)
+
+    monkeypatch.setattr(block_manifest, "iter_block_digests", spy)
+    assert write_manifest(str(data_file), manifest_path, BLOCK) == complete
+    assert started_at == [4]
+
+    # A complete manifest is returned without hashing anything
+    assert write_manifest(str(data_file), manifest_path, BLOCK) == complete
+    assert started_at == [4]
+
+
+def test_diff_reports_changed_and_removed_blocks(data_file, tmp_path):
+    manifest_path = str(tmp_path / "data.manifest")
+    write_manifest(str(data_file), manifest_path, BLOCK)
+
+    unchanged = diff_blocks(str(data_file), manifest_path)
+    assert (unchanged.changed, unchanged.removed, unchanged.rehashed) == ([], [], False)
+
+    data = bytearray(data_file.read_bytes())
+    data[BLOCK * 2 + 5] ^= 0xFF
+    del data[BLOCK * 8:]
+    data_file.write_bytes(bytes(data))
+
+    diff = diff_blocks(str(data_file), manifest_path)
+    assert diff.changed == [2]
+    assert diff.removed == [8, 9, 10]
+    assert diff.block_count == 8 and diff.rehashed
+    # The manifest now describes the file as it is
+    assert read_manifest(manifest_path).digests == block_digests(bytes(data))
+    assert not os.path.exists(manifest_path + ".partial")
+
+
+def test_diff_without_a_manifest_reports_every_block(data_file, tmp_path):
+    diff = diff_blocks(str(data_file), str(tmp_path / "new.manifest"), block_size=BLOCK)
+    assert diff.changed == list(range(11)) and diff.removed == []
+
+
+def test_unusable_algorithm_writes_nothing(data_file, tmp_path):
+    manifest_path = tmp_path / "data.manifest"
+    with pytest.raises(ValueError):
+        write_manifest(str(data_file), str(manifest_path), BLOCK, algorithm="shake_256")
+    assert not manifest_path.exists()
+
+
+@pytest.mark.parametrize("block_size", [0, -1, 2 ** 32])
+def test_unusable_block_size_writes_nothing(data_file, tmp_path, block_size):
+    manifest_path = tmp_path / "data.manifest"
+    with pytest.raises(ValueError):
+        write_manifest(str(data_file), str(manifest_path), block_size)
+    assert not manifest_path.exists()
+    with pytest.raises(ValueError):
+        diff_blocks(str(data_file), str(manifest_path), block_size=block_size or -1)
+    assert not os.path.exists(str(manifest_path) + ".partial")
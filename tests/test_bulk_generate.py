@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import httpx
+import openai
+import pytest
+
+from app.jobs.bulk_generate import BulkJob, parse_args
+from bench.mock_openai import create_app
+from bench.mock_openai import parse_args as mock_args
+
+
+@pytest.fixture
+def mock_api():
+    return create_app(mock_args(["--batch-latency", "3600", "--completion-tokens", "3"]))
+
+
+def run_job(mock_api, argv):
+    async def run():
+        client = openai.AsyncOpenAI(
+            api_key="test", base_url="http://mock/v1", http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_api))
+        )
+        try:
+            return await BulkJob(parse_args(argv), client).run()
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+
+def write_input(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return str(path)
+
+
+def test_resume_appends_to_existing_output_and_submits_once(mock_api, tmp_path):
+    records = [{"id": "2", "prompt": "a"}, {"prompt": "b"}, {"id": 0, "prompt": "c"}]
+    input_path = write_input(tmp_path / "prompts.jsonl", records)
+    output = tmp_path / "results.jsonl"
+    output.write_text('{"id": "earlier"}\n')
+    argv = [input_path, str(output), "--no-wait", "--poll-interval", "0"]
+
+    # The batch is still running, so the first run only submits it
+    assert run_job(mock_api, argv) is False
+    assert output.read_text() == '{"id": "earlier"}\n'
+    (batch_id,) = mock_api.state.mock.batches
+    input_file_id = mock_api.state.mock.batches[batch_id]["batch"]["input_file_id"]
+    request_ids = [json.loads(line)["custom_id"] for line in mock_api.state.mock.files[input_file_id].decode().splitlines()]
+    assert request_ids == ["2", "line-2", "0"]
+
+    # Simulate a run that crashed halfway through writing results
+    with open(output, "a") as f:
+        f.write('{"id": "torn')
+    mock_api.state.mock.batches[batch_id]["ready_at"] = 0
+
+    assert run_job(mock_api, argv) is True
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert lines[0] == {"id": "earlier"}
+    assert sorted(line["id"] for line in lines[1:]) == ["0", "2", "line-2"]
+    assert all(line["response"] for line in lines[1:])
+    assert len(mock_api.state.mock.batches) == 1
+
+    # A finished job leaves the output alone when run again
+    assert run_job(mock_api, argv) is True
+    assert len(output.read_text().splitlines()) == 4
+
+
+def test_duplicate_ids_fail_before_anything_is_submitted(mock_api, tmp_path):
+    input_path = write_input(tmp_path / "prompts.jsonl", [{"id": "line-2", "prompt": "a"}, {"prompt": "b"}])
+    with pytest.raises(ValueError, match="Duplicate id 'line-2'"):
+        run_job(mock_api, [input_path, str(tmp_path / "results.jsonl"), "--no-wait"])
+    assert not mock_api.state.mock.batches
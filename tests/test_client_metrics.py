@@ -0,0 +1,27 @@
+import asyncio
+
+import httpx
+import openai
+
+from app.services.hedging import HedgingPolicy
+from app.services.metrics import metrics
+from app.services.openai_client import OpenAIClient
+
+
+def test_micro_batch_and_hedge_counters_are_exported(upstream):
+    upstream.answer = "ok"
+    mock_openai = openai.AsyncOpenAI(
+        api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler)), max_retries=0
+    )
+    client = OpenAIClient(api_key="test", temperature=0.25, max_tokens=17, client=mock_openai, micro_batch=True, hedging=HedgingPolicy(delay=5))
+
+    async def scenario():
+        return await asyncio.gather(*(client.single_response(prompt="same prompt") for _ in range(4)))
+
+    assert asyncio.run(scenario()) == ["ok"] * 4
+
+    labels = '{model="gpt-3.5-turbo",temperature="0.25",max_tokens="17"}'
+    lines = metrics.render().splitlines()
+    assert f"openai_micro_batch_requests_total{labels} 4" in lines
+    assert f"openai_micro_batch_upstream_calls_total{labels} 1" in lines
+    assert f"openai_hedged_requests_total{labels} 0" in lines
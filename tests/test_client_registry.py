@@ -0,0 +1,33 @@
+from app.services.client_registry import ClientRegistry, client_registry
+from app.services.openai_client import get_default_openai_client, get_openai_client
+
+
+def test_one_client_per_configuration():
+    registry = ClientRegistry()
+    first = registry.get_or_create(("openai", "gpt-4"), object)
+    assert registry.get_or_create(("openai", "gpt-4"), object) is first
+    assert registry.get_or_create(("openai", "gpt-3.5-turbo"), object) is not first
+    assert len(registry) == 2
+
+
+def test_factory_can_use_the_registry():
+    registry = ClientRegistry()
+    # A factory that fetches its own dependencies from the registry must not deadlock
+    outer = registry.get_or_create("outer", lambda: ("outer", registry.get_or_create("inner", object)))
+    assert outer[1] is registry.get_or_create("inner", object)
+
+
+def test_default_client_is_the_shared_default_configuration(client):
+    assert get_default_openai_client() is get_openai_client()
+
+
+def test_query_parameters_do_not_create_clients(client, upstream):
+    upstream.answer = "hi"
+    assert client.post("/generate/single", json={"prompt": "hello"}).status_code == 200
+    clients = len(client_registry)
+    for temperature in ("0.11", "0.12", "0.13"):
+        response = client.post("/generate/single", params={"temperature": temperature, "max_tokens": 7}, json={"prompt": "hello"})
+        assert response.status_code == 200
+    assert len(client_registry) == clients
+    # The upstream call uses the default configuration, whatever the query string said
+    assert {request["temperature"] for request in upstream.requests} == {0.7}
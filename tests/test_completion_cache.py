@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+import app.services.completion_cache as completion_cache_module
+import app.services.ttl_cache as ttl_cache_module
+from app.services.completion_cache import CompletionCache
+from app.services.openai_client import OpenAIClient
+
+MESSAGES = [{"role": "user", "content": "Where is my order?"}]
+
+
+class FakeClock:
+    """Stands in for the time module in the cache modules, so TTLs can expire without sleeping."""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def time(self):
+        return time.time() + self.offset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ttl_cache_module, "time", clock)
+    monkeypatch.setattr(completion_cache_module, "time", clock)
+    return clock
+
+
+def test_nondeterministic_completions_bypass_the_cache(upstream):
+    upstream.answer = "ok"
+    mock_openai = openai.AsyncOpenAI(
+        api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler)), max_retries=0
+    )
+    cache = CompletionCache()
+    client = OpenAIClient(api_key="test", temperature=0.7, client=mock_openai, cache=cache, micro_batch=False)
+
+    async def scenario():
+        return [await client.single_response(prompt="same prompt") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["ok", "ok"]
+    assert len(upstream.requests) == 2
+    assert len(cache.memory) == 0
+    assert cache.stats["internal"]["skipped"] == 2
+
+
+def test_hit_is_served_from_sqlite_after_the_memory_tier_is_cleared(tmp_path):
+    cache = CompletionCache(sqlite_path=str(tmp_path / "cache.sqlite3"))
+
+    async def scenario():
+        await cache.set("gpt-3.5-turbo", MESSAGES, 0, 250, "It ships today.")
+        cache.memory.clear()
+        return await cache.get("gpt-3.5-turbo", MESSAGES, 0, 250)
+
+    try:
+        assert asyncio.run(scenario()) == "It ships today."
+        # The hit was promoted back into memory
+        assert len(cache.memory) == 1
+    finally:
+        cache.close()
+
+
+def test_expired_entries_are_not_returned(tmp_path, clock):
+    cache = CompletionCache(ttl=60, sqlite_path=str(tmp_path / "cache.sqlite3"))
+
+    async def scenario():
+        await cache.set("gpt-3.5-turbo", MESSAGES, 0, 250, "It ships today.")
+        assert await cache.get("gpt-3.5-turbo", MESSAGES, 0, 250) == "It ships today."
+        clock.offset = 61
+        return await cache.get("gpt-3.5-turbo", MESSAGES, 0, 250)
+
+    try:
+        # Neither the memory tier nor the SQLite tier hands out the stale completion
+        assert asyncio.run(scenario()) is None
+    finally:
+        cache.close()
@@ -0,0 +1,14 @@
+from app.services.context_window import ContextWindow, get_token_counter
+
+
+def test_token_counts_are_memoised_by_digest():
+    counter = get_token_counter("gpt-3.5-turbo")
+    prompt = "Where is my order? " * 50
+    first = counter.count_text(prompt)
+    assert counter.count_text(prompt) == first
+    # The memo keeps fixed-size digests, not the prompt text itself
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in counter._counts._entries)
+
+
+def test_context_windows_share_one_counter_per_model():
+    assert ContextWindow("gpt-4", 1000).counter is ContextWindow("gpt-4", 2000).counter
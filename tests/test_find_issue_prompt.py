@@ -0,0 +1,46 @@
+import asyncio
+
+from app.models.schemas import ConversationModel
+from app.services.chat_client import DEFAULT_ISSUES, ChatClient
+from app.services.context_window import context_budget, get_token_counter
+
+
+def long_conversation(turns, tag=""):
+    messages = [
+        {"role": "user" if number % 2 else "system", "content": f"{tag} message {number}: " + "my order has not arrived yet " * 30}
+        for number in range(turns)
+    ]
+    return ConversationModel.model_validate({"messages": messages})
+
+
+def prompt_tokens(body):
+    counter = get_token_counter(body["model"])
+    return counter.count_messages(body["messages"])
+
+
+def test_find_issue_prompt_fits_the_context_budget(client, upstream):
+    upstream.answer = "4"
+    chat_client = ChatClient()
+    budget = chat_client.classifier_client.context_window.budget
+    conversation = long_conversation(400)
+    assert get_token_counter("gpt-3.5-turbo").count_text(chat_client.prompts.transcript(conversation)) > 4 * budget
+
+    assert asyncio.run(chat_client.find_issue(conversation=conversation)) == (True, "4")
+    (body,) = upstream.requests
+    assert budget - 500 < prompt_tokens(body) <= budget
+    prompt = body["messages"][0]["content"]
+    # The latest turns are kept and the oldest ones dropped
+    assert "message 399:" in prompt and "message 0:" not in prompt
+    assert "issueID: 4" in prompt
+
+
+def test_batched_prompts_fit_the_context_budget(client, upstream):
+    upstream.answer = "4"
+    chat_client = ChatClient()
+    conversations = [long_conversation(400, tag=f"c{number}") for number in range(3)]
+
+    assert asyncio.run(chat_client.find_issues_batch(conversations, DEFAULT_ISSUES)) == [(True, "4")] * 3
+    # Each cut transcript fills a prompt of its own, so none of them are grouped
+    assert len(upstream.requests) == 3
+    for body in upstream.requests:
+        assert prompt_tokens(body) <= context_budget(body["model"], body["max_tokens"])
@@ -0,0 +1,40 @@
+ISSUES = [
+    {"issue_id": "4", "issue_name": "Order Status", "issue_description": "Customers want to know the status of their orders."},
+    {"issue_id": "2", "issue_name": "Kit Processing", "issue_description": "Customers are complaining that their kits are not being processed correctly."},
+]
+
+
+def conversation(text):
+    return {"messages": [{"role": "user", "content": text}]}
+
+
+def test_find_issue_match(client, upstream):
+    upstream.answer = "4"
+    response = client.post("/chat/find-issue", json={"conversation": conversation("what is the status of my order"), "issues": ISSUES})
+    assert response.status_code == 200
+    assert response.json() == {"found_issue": True, "issue_id": "4"}
+
+
+def test_find_issue_no_match(client, upstream):
+    upstream.answer = "NONE"
+    response = client.post("/chat/find-issue", json={"conversation": conversation("the weather is nice today"), "issues": ISSUES})
+    assert response.status_code == 200
+    assert response.json() == {"found_issue": False, "issue_id": None}
+
+
+def test_find_issue_batch_no_match(client, upstream):
+    upstream.answer = "NONE"
+    body = {"conversations": [conversation("the weather is nice today"), conversation("my cat is asleep")], "issues": ISSUES}
+    response = client.post("/chat/find-issue/batch", json=body)
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"found_issue": False, "issue_id": None}] * 2}
+
+
+def test_find_issue_by_catalogue_id(client, upstream):
+    upstream.answer = "NONE"
+    registered = client.post("/chat/issue-catalogs", json=ISSUES).json()
+    assert registered["issue_count"] == 2
+    body = {"conversation": conversation("the weather is nice today"), "issue_catalog_id": registered["issue_catalog_id"]}
+    assert client.post("/chat/find-issue", json=body).json() == {"found_issue": False, "issue_id": None}
+    body["issue_catalog_id"] = "unknown"
+    assert client.post("/chat/find-issue", json=body).status_code == 404
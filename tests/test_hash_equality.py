@@ -0,0 +1,63 @@
+import hashlib
+
+import pytest
+
+from batch_hash import decode_hash, hash_password_kdf
+from hash_equality import verify_many, verify_password, verify_passwords
+
+MALFORMED = [
+    None,
+    b"$pbkdf2-sha256$i=1$AAAA$AAAA",
+    "",
+    "not a hash",
+    "$pbkdf2-sha256$x=1$AAAA$AAAA",
+    "$pbkdf2-sha256$i=0$AAAA$AAAA",
+    "$pbkdf2-sha256$i=one$AAAA$AAAA",
+    "$pbkdf2-sha256$i=1$AAAA$",
+    "$pbkdf2-sha256$i=1$A$AAAA",
+    "$md5$i=1$AAAA$AAAA",
+    "$scrypt$ln=1,r=8$AAAA$AAAA",
+    "$scrypt$ln=64,r=8,p=1$AAAA$AAAA",
+    "$pbkdf2-sha256$i=99999999999$AAAA$AAAA",
+]
+
+
+@pytest.mark.parametrize("encoded", MALFORMED)
+def test_decode_rejects_malformed_hashes(encoded):
+    with pytest.raises(ValueError):
+        decode_hash(encoded)
+
+
+@pytest.mark.parametrize("encoded", MALFORMED)
+def test_malformed_hash_does_not_verify(encoded):
+    assert verify_password("hunter2", encoded) is False
+
+
+def test_work_factor_rejected_by_the_kdf_does_not_verify():
+    assert verify_password("hunter2", "$scrypt$ln=4,r=1073741823,p=1073741823$AAAA$AAAA") is False
+    assert verify_password("hunter2", "$scrypt$ln=4,r=99999999999999999999,p=1$AAAA$AAAA") is False
+
+
+def test_round_trip():
+    encoded = hash_password_kdf("hunter2", params={"i": 1000})
+    assert verify_password("hunter2", encoded)
+    assert not verify_password("hunter3", encoded)
+    encoded = hash_password_kdf("hunter2", "scrypt", params={"ln": 4, "r": 8, "p": 1})
+    assert verify_password("hunter2", encoded)
+
+
+def test_bad_row_does_not_abort_the_batch():
+    encoded = hash_password_kdf("hunter2", params={"i": 1000})
+    pairs = [
+        ("hunter2", encoded),
+        ("hunter2", "$pbkdf2-sha256$x=1$AAAA$AAAA"),
+        ("hunter2", "$pbkdf2-sha256$i=99999999999$AAAA$AAAA"),
+        ("hunter2", None),
+        ("hunter2", encoded),
+    ]
+    assert list(verify_passwords(pairs, workers=1, chunksize=1)) == [True, False, False, False, True]
+
+
+def test_verify_many_rejects_stored_values_that_are_not_hex():
+    stored = hashlib.sha256(b"hunter2").hexdigest()
+    assert verify_many([("hunter2", stored), ("hunter2", "zz"), ("hunter2", None), ("hunter2", 42)]) == [True, False, False, False]
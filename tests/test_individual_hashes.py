@@ -0,0 +1,47 @@
+import hashlib
+
+import pytest
+
+import individual_hashes
+from individual_hashes import hash_blocks_compact, hash_blocks_individually, iter_block_digests, merkle_root
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(256)) * 1000)
+    return path
+
+
+def test_block_digests_match_hashlib(data_file):
+    data = data_file.read_bytes()
+    expected = [hashlib.sha256(data[offset:offset + 4096]).digest() for offset in range(0, len(data), 4096)]
+    assert [digest for _, digest in iter_block_digests(data_file, 4096, workers=3)] == expected
+    assert hash_blocks_compact(data_file, 4096) == b"".join(expected)
+    assert hash_blocks_individually(data_file, 4096) == [digest.hex() for digest in expected]
+    assert [index for index, _ in iter_block_digests(data_file, 4096, start_block=60)] == list(range(60, 63))
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    assert list(iter_block_digests(path)) == []
+    assert merkle_root([]) == hashlib.sha256().digest()
+
+
+@pytest.mark.parametrize("algorithm", ["shake_128", "not-a-hash"])
+def test_unusable_algorithm_is_rejected_up_front(data_file, algorithm):
+    with pytest.raises(ValueError):
+        list(iter_block_digests(data_file, 4096, algorithm))
+
+
+def test_worker_error_is_not_hidden_by_the_map(data_file, monkeypatch):
+    def failing_hash(algorithm, view, offset, block_size):
+        block = view[offset:offset + block_size]
+        if offset >= 8192:
+            raise RuntimeError("read error")
+        return hashlib.new(algorithm, block).digest()
+
+    monkeypatch.setattr(individual_hashes, "_hash_block", failing_hash)
+    with pytest.raises(RuntimeError, match="read error"):
+        list(iter_block_digests(data_file, 4096, workers=2))
@@ -0,0 +1,56 @@
+import pytest
+
+import app.services.chat_client as chat_client_module
+from app.models.schemas import ConversationModel, Issue
+from app.services.chat_client import ChatClient
+
+ORDER_ISSUES = [
+    Issue(issue_id="1", issue_name="Order Status", issue_description="Customers want to know the status of their orders."),
+    Issue(issue_id="2", issue_name="Kit Processing", issue_description="Kits are not being processed correctly."),
+]
+BILLING_ISSUES = [
+    Issue(issue_id="1", issue_name="Invoice Missing", issue_description="Customers did not receive their invoice."),
+    Issue(issue_id="2", issue_name="Refund Delayed", issue_description="Refunds take too long to arrive."),
+]
+
+
+def conversation(text):
+    return ConversationModel.model_validate({"messages": [{"role": "user", "content": text}]})
+
+
+@pytest.fixture
+def chat_client(client):
+    return ChatClient()
+
+
+def test_no_lexical_overlap_still_asks_the_model(chat_client):
+    answer, candidates = chat_client.prefilter_issues(ORDER_ISSUES, conversation("where is my package? it should have arrived yesterday"))
+    assert answer is None
+    assert candidates == ORDER_ISSUES
+
+
+def test_short_circuit_is_opt_in(chat_client, monkeypatch):
+    monkeypatch.setattr(chat_client_module, "ISSUE_PREFILTER_DECIDES", True)
+    answer, _ = chat_client.prefilter_issues(ORDER_ISSUES, conversation("the weather is nice today"))
+    assert answer == (False, None)
+
+
+def test_lists_with_the_same_ids_get_separate_indexes(chat_client, monkeypatch):
+    monkeypatch.setattr(chat_client_module, "ISSUE_PREFILTER_TOP_K", 1)
+    _, candidates = chat_client.prefilter_issues(ORDER_ISSUES, conversation("what is the status of my order"))
+    assert candidates == [ORDER_ISSUES[0]]
+    _, candidates = chat_client.prefilter_issues(BILLING_ISSUES, conversation("my refund is delayed"))
+    assert candidates == [BILLING_ISSUES[1]]
+    # The first list's index was not overwritten by the second one
+    _, candidates = chat_client.prefilter_issues(ORDER_ISSUES, conversation("what is the status of my order"))
+    assert candidates == [ORDER_ISSUES[0]]
+    assert chat_client.issue_index(ORDER_ISSUES) is not chat_client.issue_index(BILLING_ISSUES)
+    assert len(chat_client.issue_index(ORDER_ISSUES)) == 2
+
+
+def test_index_cache_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(chat_client_module, "ISSUE_INDEX_CACHE_SIZE", 2)
+    chat_client = ChatClient()
+    for number in range(5):
+        chat_client.issue_index([Issue(issue_id="1", issue_name=f"Issue {number}", issue_description="Something broke.")])
+    assert len(chat_client._issue_indexes) == 2
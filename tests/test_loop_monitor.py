@@ -0,0 +1,23 @@
+import asyncio
+import logging
+import time
+
+from app.services.loop_monitor import LoopMonitor
+
+
+def test_stall_is_recorded_and_logged(caplog):
+    async def scenario():
+        monitor = LoopMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)  # Blocks the loop
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    with caplog.at_level(logging.WARNING, logger="app.services.loop_monitor"):
+        monitor = asyncio.run(scenario())
+
+    assert monitor.blocked_total >= 1
+    assert any("test_loop_monitor.py" in line for incident in monitor.incidents for line in incident["stack"])
+    assert any("Event loop blocked" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,17 @@
+from app.models.schemas import ConversationModel
+from app.services.prompt_builder import PromptBuilder
+
+
+def conversation(*turns):
+    return ConversationModel.model_validate({"messages": [{"role": role, "content": content} for role, content in turns]})
+
+
+def test_transcript_depends_only_on_content():
+    prompts = PromptBuilder()
+    first = prompts.transcript(conversation(("system", "How can I help?"), ("user", "My ORDER is late")))
+    assert first == "ASSISTANT: HOW CAN I HELP?\nuser: my order is late"
+
+    # A later turn arrives as a new request with new objects: earlier lines come from the line cache
+    longer = conversation(("system", "How can I help?"), ("user", "My ORDER is late"), ("user", "Still waiting"))
+    assert prompts.transcript(longer) == first + "\nuser: still waiting"
+    assert len(prompts._lines) == 3
@@ -0,0 +1,106 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+import openai
+import pytest
+
+import app.services.rate_limiter as rate_limiter
+from app.services.rate_limiter import OPENAI_MAX_RETRIES, ModelLimiter, call_with_retries, parse_retry_after
+from app.services.request_context import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after-ms": "soon", "retry-after": "3"}, 3.0),
+    ({"retry-after": "soon"}, None),
+    ({"retry-after": "Mon, 99 Foo 2024 99:99:99 GMT"}, None),
+    ({"retry-after": "nan"}, None),
+    ({"retry-after": "-5"}, 0.0),
+    ({}, None),
+    (None, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_parse_retry_after_http_date():
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after({"retry-after": retry_at}) <= 30
+
+
+def status_error(error_class, status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return error_class("upstream error", response=response, body=None)
+
+
+def failing_call(errors):
+    calls = []
+
+    async def call():
+        calls.append(None)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return call, calls
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "OPENAI_RETRY_BASE_DELAY", 0)
+
+
+def test_interactive_waiters_are_served_before_batch_waiters():
+    async def scenario():
+        # 1200 requests a minute refill one request every 50ms; start from an empty bucket so everybody queues
+        limiter = ModelLimiter(requests_per_minute=1200, tokens_per_minute=1000000)
+        limiter.requests.tokens = 0
+        served = []
+
+        async def request(name, priority):
+            await limiter.acquire(1, priority)
+            served.append(name)
+
+        await asyncio.gather(
+            *(request(f"batch-{number}", PRIORITY_BATCH) for number in range(3)),
+            *(request(f"interactive-{number}", PRIORITY_INTERACTIVE) for number in range(3)),
+        )
+        return served
+
+    assert asyncio.run(scenario()) == [f"interactive-{number}" for number in range(3)] + [f"batch-{number}" for number in range(3)]
+
+
+def test_block_for_holds_the_queue_after_a_429():
+    async def scenario():
+        limiter = ModelLimiter(requests_per_minute=1000, tokens_per_minute=1000000)
+        assert await limiter.acquire(1, PRIORITY_INTERACTIVE) == 0
+        limiter.block_for(0.2)
+        return await limiter.acquire(1, PRIORITY_INTERACTIVE)
+
+    assert asyncio.run(scenario()) >= 0.19
+
+
+def test_retries_stop_at_the_configured_maximum(no_backoff):
+    errors = [status_error(openai.InternalServerError, 500) for _ in range(OPENAI_MAX_RETRIES + 1)]
+    call, calls = failing_call(errors)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(call_with_retries(call))
+    assert len(calls) == OPENAI_MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried(no_backoff):
+    call, calls = failing_call([status_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(call_with_retries(call))
+    assert len(calls) == 1
+
+
+def test_rate_limited_call_blocks_the_limiter_for_retry_after(no_backoff):
+    call, calls = failing_call([status_error(openai.RateLimitError, 429, {"retry-after-ms": "10"})])
+    blocked = []
+    assert asyncio.run(call_with_retries(call, on_rate_limited=blocked.append)) == "ok"
+    assert len(calls) == 2
+    assert blocked == [0.01]
@@ -0,0 +1,73 @@
+import asyncio
+
+from app.routes.ws.session import StreamSession
+
+
+def receive_until(ws, request_id, final_types=("done", "error", "cancelled")):
+    messages = []
+    while True:
+        message = ws.receive_json()
+        messages.append(message)
+        if message["request_id"] == request_id and message["type"] in final_types:
+            return messages
+
+
+def test_malformed_frames_do_not_end_the_session(client, upstream):
+    with client.websocket_connect("/ws/generate") as ws:
+        ws.send_text("{not json")
+        assert ws.receive_json() == {"request_id": None, "type": "error", "detail": "Messages must be JSON objects"}
+
+        ws.send_json([1, 2, 3])
+        assert ws.receive_json()["type"] == "error"
+
+        # An unhashable request_id cannot be used as a key
+        ws.send_json({"request_id": ["a"], "type": "single", "prompt": "x"})
+        error = ws.receive_json()
+        assert error["request_id"] is None and error["type"] == "error"
+
+        ws.send_bytes(b"\xff\xfe")
+        assert ws.receive_json()["type"] == "error"
+
+        # The socket still serves requests afterwards
+        ws.send_json({"request_id": "a", "type": "single", "prompt": "x"})
+        messages = receive_until(ws, "a")
+        assert [message["type"] for message in messages] == ["delta", "delta", "done"]
+
+
+def test_unknown_message_type_is_an_error(client):
+    with client.websocket_connect("/ws/generate") as ws:
+        ws.send_json({"request_id": 7, "type": "nope"})
+        assert receive_until(ws, 7)[-1]["type"] == "error"
+
+
+class SlowSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        await asyncio.sleep(0.01)
+        self.sent.append(text)
+
+
+def test_final_frames_wait_for_room_in_the_outbox():
+    async def scenario():
+        session = StreamSession(SlowSocket(), send_queue_size=1)
+        writer = asyncio.ensure_future(session._writer())
+
+        async def work():
+            for index in range(5):
+                await session.send("a", "delta", content=str(index))
+            raise RuntimeError("upstream failed")
+
+        await session.start("a", work)
+        while session.tasks:
+            await asyncio.sleep(0.01)
+        while not session.outbox.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        writer.cancel()
+        return session.websocket.sent
+
+    sent = asyncio.run(scenario())
+    assert len(sent) == 6
+    assert '"type":"error"' in sent[-1]